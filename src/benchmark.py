@@ -0,0 +1,229 @@
+import time
+from argparse import ArgumentParser
+from types import SimpleNamespace
+
+import numpy as np
+
+from scene.scenes import Point
+from scene.profiler import profiler
+from planner import VisibilityGraphPlanner, ReducedVisibilityGraphPlanner
+from scene_file import SceneData, headless_scene
+from preprocessing import ObstaclePreprocessor
+from fleet import free_points
+import kernels
+
+
+def parse_args() -> object:
+    parser = ArgumentParser()
+
+    parser.add_argument(
+        "--complete",
+        action = "store_true",
+        help = "Usa el grafo de visibilidad completo"
+    )
+    parser.add_argument(
+        "--scene",
+        default = None,
+        type = str,
+        help = "Escena binaria, .wkt o .geojson"
+    )
+    parser.add_argument(
+        "--map",
+        default = None,
+        type = str,
+        help = "Imagen o rejilla .npy de ocupación"
+    )
+    parser.add_argument(
+        "--queries",
+        default = 100,
+        type = int,
+        help = "Cantidad de pares salida/meta aleatorios"
+    )
+    parser.add_argument(
+        "--seed",
+        default = 0,
+        type = int,
+        help = "Semilla de los puntos aleatorios"
+    )
+    parser.add_argument(
+        "--kernels",
+        default = "auto",
+        choices = ("auto", "all") + kernels.BACKENDS,
+        help = "Núcleos geométricos; all compara cada uno instalado"
+    )
+    parser.add_argument(
+        "--preprocess",
+        action = "store_true",
+        help = "Compara la construcción del grafo con y sin preprocesamiento"
+    )
+    parser.add_argument(
+        "--tolerance",
+        default = 0.01,
+        type = float,
+        help = "Tolerancia de la simplificación Douglas-Peucker"
+    )
+    parser.add_argument(
+        "--repeats",
+        default = 5,
+        type = int,
+        help = "Construcciones por medición, se reporta la más rápida"
+    )
+    parser.add_argument(
+        "--profile",
+        default = None,
+        type = str,
+        help = "Guarda los tiempos por etapa y contadores en JSON"
+    )
+    parser.add_argument(
+        "--trace",
+        default = None,
+        type = str,
+        help = "Guarda una traza para chrome://tracing"
+    )
+
+    args = parser.parse_args()
+    return args
+
+def same_graph(planner: object, reference: object) -> bool:
+    graph = planner.static_graph.tocsr()
+    expected = reference.static_graph.tocsr()
+    return (
+        graph.shape == expected.shape and
+        (graph != expected).nnz == 0 and
+        np.array_equal(planner.start_edges, reference.start_edges) and
+        np.array_equal(planner.goal_edges, reference.goal_edges)
+    )
+
+class PreprocessingReport:
+    #Build times are the best of several runs, a single one is mostly noise
+    def __init__(
+            self,
+            polygons: list,
+            processed: list,
+            planner_cls: type,
+            repeats: int = 5
+        ) -> None:
+        self.vertices_before = sum(polygon.len for polygon in polygons)
+        self.vertices_after = sum(polygon.len for polygon in processed)
+        self.time_before, self.nodes_before = self.time_build(
+            polygons, planner_cls, repeats
+        )
+        self.time_after, self.nodes_after = self.time_build(
+            processed, planner_cls, repeats
+        )
+
+    @staticmethod
+    def time_build(polygons: list, planner_cls: type, repeats: int) -> tuple:
+        scene = SimpleNamespace(polygons=polygons)
+        times = []
+        for _ in range(max(1, repeats)):
+            tic = time.perf_counter()
+            planner = planner_cls(scene, Point(-0.9, 0.9), Point(0.9, 0.9))
+            times.append(time.perf_counter() - tic)
+        return min(times), planner.n_vertices
+
+    @property
+    def reduction(self) -> float:
+        return 1 - self.vertices_after/self.vertices_before
+
+    @property
+    def speedup(self) -> float:
+        return self.time_before/self.time_after
+
+    def __str__(self) -> str:
+        return (
+            f"vertices: {self.vertices_before} -> {self.vertices_after} "
+            f"({100*self.reduction:.1f}% less), "
+            f"graph nodes: {self.nodes_before} -> {self.nodes_after}, "
+            f"build: {1000*self.time_before:.2f} ms -> "
+            f"{1000*self.time_after:.2f} ms ({self.speedup:.2f}x)"
+        )
+
+def run(args: object, planner_cls: type, scene: SimpleNamespace) -> object:
+    print(f"kernels: {kernels.backend.name}")
+    tic = time.perf_counter()
+    planner = planner_cls(scene, Point(-0.9, 0.9), Point(0.9, 0.9))
+    print(f"build: {1000*(time.perf_counter() - tic):.2f} ms, "
+          f"{planner.n_vertices} vertices")
+    profiler.end_frame()
+
+    #Endpoints outside the obstacles; queries without a path are counted
+    #apart and left out of the timings and the profile
+    rng = np.random.default_rng(args.seed)
+    points = free_points(scene.scene_data, 2*args.queries, rng)
+    failed = 0
+    elapsed = 0.0
+    for x0, y0, x1, y1 in points.reshape(-1, 4):
+        tic = time.perf_counter()
+        try:
+            planner.plan(Point(x0, y0), Point(x1, y1))
+        except ValueError:
+            failed += 1
+            profiler.end_frame()
+            profiler.frames.pop()
+            continue
+        elapsed += time.perf_counter() - tic
+        profiler.end_frame()
+    solved = args.queries - failed
+    print(f"queries: {solved} in {1000*elapsed:.2f} ms "
+          f"({1000*elapsed/max(solved, 1):.3f} ms each), {failed} without path")
+
+    summary = profiler.summary()
+    for name, stats in summary["stages_ms"].items():
+        print(f"  {name:16s} mean {stats['mean']:9.3f} ms  "
+              f"max {stats['max']:9.3f} ms  total {stats['total']:10.3f} ms")
+    for name, stats in summary["counters"].items():
+        print(f"  {name:16s} mean {stats['mean']:12.1f}  total {stats['total']}")
+
+    return planner
+
+def main() -> None:
+    args = parse_args()
+    profiler.enable()
+
+    if args.complete:
+        planner_cls = VisibilityGraphPlanner
+    else:
+        planner_cls = ReducedVisibilityGraphPlanner
+
+    scene = headless_scene(args)
+    if args.preprocess:
+        kernels.use(args.kernels if args.kernels != "all" else "auto")
+        polygons = scene.scene_data.polygons
+        processed = ObstaclePreprocessor(tolerance = args.tolerance).run(polygons)
+        report = PreprocessingReport(
+            polygons,
+            processed,
+            planner_cls,
+            args.repeats
+        )
+        print(f"preprocessing: {report}")
+        profiler.frames.clear()
+        scene = SimpleNamespace(scene_data=SceneData.from_polygons(processed))
+    if args.kernels != "all":
+        kernels.use(args.kernels)
+        run(args, planner_cls, scene)
+    else:
+        #Same scene and queries on every backend, graphs must be identical
+        planners = {}
+        for name in kernels.available():
+            kernels.use(name)
+            if name == "numba":
+                #Compile (or load from the cache) outside the timings
+                planner_cls(scene, Point(-0.9, 0.9), Point(0.9, 0.9))
+                profiler.end_frame()
+            profiler.frames.clear()
+            planners[name] = run(args, planner_cls, scene)
+        reference = planners["numpy"]
+        for name, planner in planners.items():
+            same = same_graph(planner, reference)
+            print(f"{name}: {'identical' if same else 'DIFFERENT'} graph")
+
+    if args.profile is not None:
+        profiler.export_json(args.profile)
+    if args.trace is not None:
+        profiler.export_chrome_trace(args.trace)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,67 @@
+import numpy as np
+
 from planner import VisibilityGraphPlanner
-from shapes import Segment, Point
+from shapes import Point, Path
+
+
+class Trajectory:
+    #Shortest path parameterized by arc length, from start to goal
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        points = np.array([[point.x, point.y] for point in path.points[::-1]])
+        self.points = points
+        seg_lengths = np.hypot(*np.diff(points, axis=0).T)
+        self.arc = np.concatenate([[0], np.cumsum(seg_lengths)])
+        self.length = self.arc[-1]
+
+    def at(self, s: np.ndarray) -> np.ndarray:
+        s = np.clip(s, 0, self.length)
+        return np.stack([
+            np.interp(s, self.arc, self.points[:, 0]),
+            np.interp(s, self.arc, self.points[:, 1])
+        ], axis=-1)
+
+    def project(self, point: np.ndarray) -> tuple:
+        #Closest arc length on the trajectory and the distance to it
+        if len(self.points) < 2:
+            return 0.0, float(np.hypot(*(point - self.points[0])))
+        a, b = self.points[:-1], self.points[1:]
+        ab = b - a
+        norm = np.sum(ab**2, axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.clip(np.sum((point - a)*ab, axis=1)/norm, 0, 1)
+        t[norm == 0] = 0
+        closest = a + t[:, None]*ab
+        dist = np.hypot(*(closest - point).T)
+        k = int(np.argmin(dist))
+        return self.arc[k] + t[k]*np.sqrt(norm[k]), float(dist[k])
+
+    def remaining(self, s: float) -> Path:
+        #Path from the point at s to the goal, ordered like planner paths
+        k = np.searchsorted(self.arc, s, side="right")
+        current = self.at(s)
+        points = [Point(*point) for point in self.points[k:].tolist()]
+        return Path(points[::-1] + [Point(*current.tolist())])
+
 
 class ConstantVelocityParticle:
-    def __init__(self, planner: VisibilityGraphPlanner) -> None:
+    #Follows the cached trajectory of the last shortest path and only asks the
+    #planner for a new one when the path changes or the particle is moved off
+    #it; moving along the optimal path never changes the rest of it.
+    def __init__(
+            self,
+            planner: VisibilityGraphPlanner,
+            tolerance: float = 1e-6
+        ) -> None:
         self.planner = planner
         self._speed = 0.5
+        self.tolerance = tolerance
+        self.replans = 0
+        self._trajectory = None
+        self._s = 0.0
+        self._position = np.array([planner.start.x, planner.start.y])
+        #Path that was current when the particle was moved off it
+        self._held = None
 
     @property
     def speed(self) -> float:
@@ -14,21 +71,110 @@ class ConstantVelocityParticle:
     def speed(self, value: float) -> None:
         self._speed = value
 
+    @property
+    def position(self) -> Point:
+        return Point(*self._position.tolist())
+
+    @position.setter
+    def position(self, point: Point) -> None:
+        trajectory = self.trajectory
+        previous = (self._position, self._held)
+        self._position = np.array([point.x, point.y])
+        s, dist = trajectory.project(self._position)
+        if dist > self.tolerance:
+            #Stay here until the path from here arrives (later when threaded)
+            self._held = trajectory.path
+            try:
+                self.replan()
+            except ValueError:
+                #No path from there, the particle stays where it was
+                self._position, self._held = previous
+                raise
+        else:
+            self._s = s
+
+    @property
+    def trajectory(self) -> Trajectory:
+        shortest_path = self.planner.shortest_path
+        if self._trajectory is None or self._trajectory.path is not shortest_path:
+            #New start, goal or obstacles. A threaded plan may arrive after the
+            #particle moved on, so continue from the closest point of the new
+            #path instead of going back to its start.
+            self._trajectory = Trajectory(shortest_path)
+            self._s, _ = self._trajectory.project(self._position)
+            self._position = self._trajectory.at(self._s)
+            self._held = None
+        return self._trajectory
+
+    def replan(self, goal: Point = None) -> None:
+        #Moves the planner start to where the particle actually is, both
+        #endpoints in a single search
+        current = self.planner.start
+        moved = current.x != self._position[0] or current.y != self._position[1]
+        if not moved and goal is None:
+            return
+        if goal is None:
+            goal = self.planner.goal
+        self.planner.plan(self.position, goal)
+        self.replans += 1
+
+    def stop(self) -> None:
+        #The current path is no longer valid, e.g. an obstacle now cuts it:
+        #stay here until the planner has a new one
+        self._held = self.trajectory.path
+
+    def remaining_path(self) -> Path:
+        trajectory = self.trajectory
+        if self._held is trajectory.path:
+            return Path([self.position])
+        return trajectory.remaining(self._s)
+
+    def reached_goal(self) -> bool:
+        trajectory = self.trajectory
+        return self._s >= trajectory.length
+
     def update(self, dt: float) -> None:
-        if self.planner.reached_goal():
+        if self.reached_goal():
             return
 
         if self._speed == 0:
             return
-        shortest_path = self.planner.shortest_path
-        current = self.planner.start
-        next = shortest_path[-2]
+        trajectory = self.trajectory
+        if self._held is trajectory.path:
+            return
+        self._s = min(self._s + self._speed*dt, trajectory.length)
+        self._position = trajectory.at(self._s)
+
+    def fast_forward(self, dt: float) -> np.ndarray:
+        #Every position until the goal in one call, the particle ends there
+        trajectory = self.trajectory
+        step = self._speed*dt
+        if step <= 0:
+            return np.empty((0, 2))
+        n_steps = int(np.ceil((trajectory.length - self._s)/step))
+        s = self._s + step*np.arange(1, n_steps + 1)
+        positions = trajectory.at(s)
+        self._s = trajectory.length
+        self._position = trajectory.at(self._s)
+        return positions
 
-        x, y = current.x, current.y
-        dx, dy = (next.x - x), (next.y - y)
-        norm = (dx**2 + dy**2)**0.5
-        dx, dy = dx/norm, dy/norm
 
-        x += self._speed * dt * dx
-        y += self._speed * dt * dy
-        self.planner.start = Point(x, y)
+def simulate_missions(
+        planner: VisibilityGraphPlanner,
+        missions: np.ndarray,
+        speed: float = 0.5,
+        dt: float = 0.05
+    ) -> list:
+    #Headless evaluation: one plan and one vectorized traversal per
+    #(x_start, y_start, x_goal, y_goal) row. None when there is no path.
+    driver = ConstantVelocityParticle(planner)
+    driver.speed = speed
+    trajectories = []
+    for x0, y0, x1, y1 in missions:
+        try:
+            planner.plan(Point(x0, y0), Point(x1, y1))
+        except ValueError:
+            trajectories.append(None)
+            continue
+        trajectories.append(driver.fast_forward(dt))
+    return trajectories
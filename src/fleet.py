@@ -0,0 +1,178 @@
+import numpy as np
+from scipy.sparse import coo_array
+from scipy.sparse.csgraph import dijkstra
+
+from planner import VisibilityGraphPlanner
+from scene_file import SceneData
+from geometry import points_in_polygon
+from scene.profiler import profiler
+import kernels
+
+SEGMENTS_PER_BATCH = 1 << 16
+
+
+class Fleet:
+    #Many agents on one planner. The static vertex graph is shared, goals are
+    #linked once per distinct goal and every agent only keeps the index of the
+    #node it is heading to; positions live in one (N, 2) array.
+    def __init__(
+            self,
+            planner: VisibilityGraphPlanner,
+            positions: np.ndarray,
+            goals: np.ndarray,
+            speed: float = 0.5
+        ) -> None:
+        self.planner = planner
+        self.speed = speed
+        self.vertices = np.asarray(planner.vertex_array, dtype=float)
+        self.n_vertices = len(self.vertices)
+        self.static_graph = self.get_static_graph()
+        self.positions = np.array(positions, dtype=float).reshape(-1, 2)
+        self.set_goals(goals)
+
+    @property
+    def n_agents(self) -> int:
+        return len(self.positions)
+
+    def get_static_graph(self) -> coo_array:
+        #The planner keeps one triangle, Dijkstra here runs directed
+        graph = self.planner.static_graph
+        rows, cols, weights = graph.row, graph.col, graph.data
+        return coo_array(
+            (np.r_[weights, weights], (np.r_[rows, cols], np.r_[cols, rows])),
+            shape=(self.n_vertices, self.n_vertices)
+        )
+
+    def visibility(self, points: np.ndarray, targets: np.ndarray) -> np.ndarray:
+        #(len(points), len(targets)) mask of free segments, tested in batches
+        free = np.zeros((len(points), len(targets)), dtype=bool)
+        step = max(1, SEGMENTS_PER_BATCH//max(len(targets), 1))
+        for a in range(0, len(points), step):
+            chunk = points[a:a + step]
+            segments = np.empty((len(chunk), len(targets), 4))
+            segments[..., :2] = chunk[:, None, :]
+            segments[..., 2:] = targets[None, :, :]
+            free[a:a + step] = kernels.backend.segments_free(
+                segments.reshape(-1, 4),
+                self.planner.edge_array
+            ).reshape(len(chunk), len(targets))
+        return free
+
+    def set_goals(self, goals: np.ndarray) -> None:
+        with profiler.stage("fleet_link"):
+            goals = np.broadcast_to(
+                np.asarray(goals, dtype=float),
+                (self.n_agents, 2)
+            )
+            self.goals = goals.copy()
+            unique, self.goal_ids = np.unique(goals, axis=0, return_inverse=True)
+            self.goal_ids = self.goal_ids.ravel()
+            self.unique_goals = unique
+            n_goals = len(unique)
+            n_nodes = self.n_vertices + n_goals
+
+            #Goal nodes appended after the vertices, one Dijkstra for all.
+            #Goals only have outgoing edges so no route crosses another goal.
+            goal_vis = self.visibility(unique, self.vertices)
+            goal_rows, goal_cols = np.nonzero(goal_vis)
+            goal_weights = np.hypot(
+                *(unique[goal_rows] - self.vertices[goal_cols]).T
+            )
+            goal_rows = goal_rows + self.n_vertices
+            static = self.static_graph
+            graph = coo_array(
+                (
+                    np.r_[static.data, goal_weights],
+                    (
+                        np.r_[static.row, goal_rows],
+                        np.r_[static.col, goal_cols]
+                    )
+                ),
+                shape=(n_nodes, n_nodes)
+            ).tocsr()
+        with profiler.stage("fleet_dijkstra"):
+            dist, predecessors = dijkstra(
+                graph,
+                directed=True,
+                indices=np.arange(self.n_vertices, n_nodes),
+                return_predecessors=True
+            )
+        self.dist_to_goal = dist[:, :self.n_vertices]
+        self.next_hop = predecessors[:, :self.n_vertices]
+        self.relink()
+
+    def relink(self) -> None:
+        #First waypoint of every agent: a visible vertex or its goal directly
+        with profiler.stage("fleet_link"):
+            vis = self.visibility(self.positions, self.vertices)
+            to_vertex = np.linalg.norm(
+                self.positions[:, None, :] - self.vertices[None, :, :],
+                axis=2
+            )
+            cost = np.where(
+                vis,
+                to_vertex + self.dist_to_goal[self.goal_ids],
+                np.inf
+            )
+            cost = np.hstack([cost, np.full((self.n_agents, 1), np.inf)])
+            best = np.argmin(cost, axis=1)
+            best_cost = cost[np.arange(self.n_agents), best]
+
+            segments = np.hstack([self.positions, self.goals])
+            direct = kernels.backend.segments_free(segments, self.planner.edge_array)
+            direct_cost = np.where(
+                direct,
+                np.hypot(*(self.goals - self.positions).T),
+                np.inf
+            )
+            #-1 heads to the goal, -2 has no path
+            self.targets = np.where(direct_cost <= best_cost, -1, best)
+            self.targets[np.isinf(np.minimum(direct_cost, best_cost))] = -2
+
+    def target_points(self) -> np.ndarray:
+        points = self.goals.copy()
+        on_vertex = self.targets >= 0
+        points[on_vertex] = self.vertices[self.targets[on_vertex]]
+        return points
+
+    @property
+    def arrived(self) -> np.ndarray:
+        return np.all(self.positions == self.goals, axis=1)
+
+    def update(self, dt: float) -> None:
+        with profiler.stage("fleet_update"):
+            moving = (self.targets != -2) & ~self.arrived
+            targets = self.target_points()
+            disp = targets - self.positions
+            dist = np.hypot(*disp.T)
+            step = self.speed*dt
+            reach = moving & (dist <= step)
+            advance = moving & ~reach
+            self.positions[advance] += step*disp[advance]/dist[advance, None]
+            self.positions[reach] = targets[reach]
+
+            #Agents on a vertex continue to its predecessor towards the goal
+            hop = reach & (self.targets >= 0)
+            nxt = self.next_hop[self.goal_ids[hop], self.targets[hop]]
+            self.targets[hop] = np.where(nxt >= self.n_vertices, -1, nxt)
+
+
+def free_points(
+        data: SceneData,
+        n_points: int,
+        rng: np.random.Generator,
+        bounds: tuple = (-0.95, 0.95)
+    ) -> np.ndarray:
+    #Uniform samples outside every obstacle
+    points = np.empty((0, 2))
+    arrays = [
+        np.asarray(data.coords[a:b])
+        for a, b in zip(data.offsets[:-1], data.offsets[1:])
+    ]
+    while len(points) < n_points:
+        candidates = rng.uniform(*bounds, (2*n_points, 2))
+        inside = np.zeros(len(candidates), dtype=bool)
+        for coords in arrays:
+            inside |= points_in_polygon(candidates, coords)
+        points = np.vstack([points, candidates[~inside]])
+    return points[:n_points]
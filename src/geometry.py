@@ -0,0 +1,373 @@
+import numpy as np
+
+from scene.profiler import profiler
+
+#Upper bound on segment/edge pairs tested at once
+PAIRS_PER_CHUNK = 1 << 20
+
+
+def signed_area(coords: np.ndarray) -> float:
+    x, y = coords[:, 0], coords[:, 1]
+    return 0.5*float(np.sum(x*np.roll(y, -1) - np.roll(x, -1)*y))
+
+def clockwise(coords: np.ndarray) -> np.ndarray:
+    #Polygons are expected in clockwise order (see docs/reporte.md)
+    if signed_area(coords) > 0:
+        return coords[::-1].copy()
+    return coords
+
+def vertex_crosses(coords: np.ndarray) -> np.ndarray:
+    prev_disp = coords - np.roll(coords, 1, axis=0)
+    next_disp = np.roll(coords, -1, axis=0) - coords
+    return prev_disp[:, 0]*next_disp[:, 1] - prev_disp[:, 1]*next_disp[:, 0]
+
+def neighbour_indices(offsets: np.ndarray) -> tuple:
+    #Previous and next vertex of every vertex, wrapping inside each polygon
+    idx = np.arange(offsets[-1])
+    sizes = np.diff(offsets)
+    firsts = offsets[:-1][sizes > 0]
+    lasts = offsets[1:][sizes > 0] - 1
+    prev, nxt = idx - 1, idx + 1
+    prev[firsts] = lasts
+    nxt[lasts] = firsts
+    return prev, nxt
+
+def polygon_ids(offsets: np.ndarray) -> np.ndarray:
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+def polygon_edges(coords: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    #Edges of all polygons as rows (x_a, y_a, x_b, y_b, x_p, y_p, x_n, y_n),
+    #where p is the vertex before a and n the one after b. With p and n the
+    #rows also describe the corners at both ends.
+    prev, nxt = neighbour_indices(offsets)
+    return np.hstack([coords, coords[nxt], coords[prev], coords[nxt[nxt]]])
+
+def polygon_vertex_crosses(
+        coords: np.ndarray,
+        offsets: np.ndarray
+    ) -> np.ndarray:
+    prev, nxt = neighbour_indices(offsets)
+    prev_disp = coords - coords[prev]
+    next_disp = coords[nxt] - coords
+    return prev_disp[:, 0]*next_disp[:, 1] - prev_disp[:, 1]*next_disp[:, 0]
+
+def inner_diagonals(
+        coords: np.ndarray,
+        prev: np.ndarray,
+        nxt: np.ndarray,
+        i: int,
+        js: np.ndarray
+    ) -> np.ndarray:
+    #Whether the segment from vertex i to each of js leaves i through the
+    #inside of its polygon, between its two edges.
+    #Angles are in (-pi, pi] so one 2*pi turn is all the loops ever add.
+    x, y = coords[i]
+    angle = np.arctan2(coords[js, 1] - y, coords[js, 0] - x)
+    prev_angle = np.arctan2(coords[nxt[i], 1] - y, coords[nxt[i], 0] - x)
+    next_to_angle = np.arctan2(coords[prev[i], 1] - y, coords[prev[i], 0] - x)
+    angle = np.where(angle < next_to_angle, angle + 2*np.pi, angle)
+    if prev_angle < next_to_angle:
+        prev_angle += 2*np.pi
+    return (next_to_angle < angle) & (angle < prev_angle)
+
+def tangent_mask(
+        points: np.ndarray,
+        goals: np.ndarray,
+        coords: np.ndarray,
+        prev: np.ndarray,
+        nxt: np.ndarray
+    ) -> np.ndarray:
+    #Whether the line from every point to the polygon vertex with the same
+    #row in goals leaves both neighbours of that vertex on one side
+    goal = coords[goals]
+    prev_goal = coords[nxt[goals]]
+    next_goal = coords[prev[goals]]
+    dy = goal[:, 1] - points[:, 1]
+    dx = goal[:, 0] - points[:, 0]
+    prev_cross = (
+        dy*(prev_goal[:, 0] - goal[:, 0]) -
+        dx*(prev_goal[:, 1] - goal[:, 1])
+    )
+    next_cross = (
+        dy*(next_goal[:, 0] - goal[:, 0]) -
+        dx*(next_goal[:, 1] - goal[:, 1])
+    )
+    return prev_cross*next_cross > 0
+
+def segments_blocked(segments: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    #A segment is blocked by an edge it properly crosses, or when it runs
+    #through one of the edge's vertices into the obstacle. Touching a vertex
+    #or sliding along a side does not block, so paths can graze obstacles.
+    #Rows of edges are (x_a, y_a, x_b, y_b, x_p, y_p, x_n, y_n), see
+    #polygon_edges.
+    x1, y1 = segments[:, None, 0], segments[:, None, 1]
+    dx = segments[:, None, 2] - x1
+    dy = segments[:, None, 3] - y1
+    ax = edges[None, :, 0] - x1
+    ay = edges[None, :, 1] - y1
+    bx = edges[None, :, 2] - x1
+    by = edges[None, :, 3] - y1
+    ex = edges[None, :, 2] - edges[None, :, 0]
+    ey = edges[None, :, 3] - edges[None, :, 1]
+    x2a = segments[:, None, 2] - edges[None, :, 0]
+    y2a = segments[:, None, 3] - edges[None, :, 1]
+    #Sides of each point against the other segment. A vertex gets the same
+    #side from both edges it belongs to, and a shared endpoint is exactly
+    #on the line, so it never counts as a proper crossing.
+    side_a = dx*ay - dy*ax
+    side_b = dx*by - dy*bx
+    side_1 = ex*ay - ey*ax
+    side_2 = ey*x2a - ex*y2a
+    blocked = opposite(side_a, side_b) & opposite(side_1, side_2)
+
+    #Vertices on the segment: check whether it enters the corner there
+    #(ahead of the start, behind the end, or both when it runs through).
+    #This also catches corners shared by touching polygons.
+    for on_line, vx, vy, corner in (
+            (side_a == 0, ax, ay, edges[:, [4, 5, 0, 1, 2, 3]]),
+            (side_b == 0, bx, by, edges[:, [0, 1, 2, 3, 6, 7]])
+        ):
+        s, e = np.nonzero(on_line)
+        if not len(s):
+            continue
+        sx, sy = dx[s, 0], dy[s, 0]
+        along = vx[s, e]*sx + vy[s, e]*sy
+        length = sx*sx + sy*sy
+        ahead, behind = enters_corner(corner[e], sx, sy)
+        blocked[s, e] |= (
+            (0 <= along) & (along < length) & ahead |
+            (0 < along) & (along <= length) & behind
+        )
+    return blocked
+
+def opposite(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return (a > 0) & (b < 0) | (a < 0) & (b > 0)
+
+def enters_corner(corners: np.ndarray, dx: np.ndarray, dy: np.ndarray) -> tuple:
+    #Corners as rows (x_p, y_p, x_v, y_v, x_n, y_n) of a clockwise polygon.
+    #Whether the rays from v along (dx, dy) and against it start inside it.
+    #Inside is right of both sides at a convex corner, of either at a
+    #concave one.
+    in_x = corners[:, 2] - corners[:, 0]
+    in_y = corners[:, 3] - corners[:, 1]
+    out_x = corners[:, 4] - corners[:, 2]
+    out_y = corners[:, 5] - corners[:, 3]
+    convex = in_x*out_y - in_y*out_x < 0
+    c_in = in_x*dy - in_y*dx
+    c_out = out_x*dy - out_y*dx
+    ahead = np.where(convex, (c_in < 0) & (c_out < 0), (c_in < 0) | (c_out < 0))
+    behind = np.where(convex, (c_in > 0) & (c_out > 0), (c_in > 0) | (c_out > 0))
+    return ahead, behind
+
+def segments_free(segments: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    free = np.ones(len(segments), dtype=bool)
+    if len(edges) == 0:
+        return free
+    profiler.count("intersection_tests", len(segments)*len(edges))
+    step = max(1, PAIRS_PER_CHUNK//len(edges))
+    for a in range(0, len(segments), step):
+        blocked = segments_blocked(segments[a:a + step], edges)
+        free[a:a + step] = ~np.any(blocked, axis=1)
+    return free
+
+def segment_lengths(segments: np.ndarray) -> np.ndarray:
+    return (
+        (segments[:, 0] - segments[:, 2])**2 +
+        (segments[:, 1] - segments[:, 3])**2
+    )**0.5
+
+def points_in_polygon(points: np.ndarray, coords: np.ndarray) -> np.ndarray:
+    #Even-odd rule; points on the boundary may land on either side
+    x, y = points[:, 0:1], points[:, 1:2]
+    xa, ya = coords[:, 0], coords[:, 1]
+    xb, yb = np.roll(xa, -1), np.roll(ya, -1)
+    straddles = (ya > y) != (yb > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_cross = xa + (y - ya)*(xb - xa)/(yb - ya)
+    crossings = straddles & (x < x_cross)
+    return np.count_nonzero(crossings, axis=1) % 2 == 1
+
+def segment_crossings(
+        segments_a: np.ndarray,
+        segments_b: np.ndarray
+    ) -> tuple:
+    #Proper crossings between every pair of segments, as parameters on both.
+    #The mask compares sides like segments_blocked, so shared endpoints are
+    #exactly on the line and never count as crossings.
+    p = segments_a[:, None, :2]
+    r = segments_a[:, None, 2:4] - p
+    q = segments_b[None, :, :2]
+    s = segments_b[None, :, 2:4] - q
+    qp = q - p
+    sp = segments_b[None, :, 2:4] - p
+    pq = segments_a[:, None, 2:4] - q
+    side_q = r[..., 0]*qp[..., 1] - r[..., 1]*qp[..., 0]
+    side_s = r[..., 0]*sp[..., 1] - r[..., 1]*sp[..., 0]
+    side_p = s[..., 1]*qp[..., 0] - s[..., 0]*qp[..., 1]
+    side_r = s[..., 0]*pq[..., 1] - s[..., 1]*pq[..., 0]
+    denom = r[..., 0]*s[..., 1] - r[..., 1]*s[..., 0]
+    t_num = qp[..., 0]*s[..., 1] - qp[..., 1]*s[..., 0]
+    u_num = qp[..., 0]*r[..., 1] - qp[..., 1]*r[..., 0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = t_num/denom
+        u = u_num/denom
+    crossings = opposite(side_q, side_s) & opposite(side_p, side_r)
+    return crossings, t, u
+
+def polygons_overlap(coords: np.ndarray, offsets: np.ndarray) -> bool:
+    #Whether two polygons cross or one holds the other. Bounding boxes sorted
+    #by x first, so only pairs whose boxes meet get the edge tests.
+    coords = np.asarray(coords, dtype=float)
+    offsets = np.asarray(offsets)
+    if len(offsets) < 3:
+        return False
+    lows = np.minimum.reduceat(coords, offsets[:-1])
+    highs = np.maximum.reduceat(coords, offsets[:-1])
+    order = np.argsort(lows[:, 0], kind="stable")
+    sorted_lows = lows[order, 0]
+    _, nxt = neighbour_indices(offsets)
+    edges = np.hstack([coords, coords[nxt]])
+    for k, a in enumerate(order.tolist()):
+        last = np.searchsorted(sorted_lows, highs[a, 0], side="right")
+        for b in order[k + 1:last].tolist():
+            if lows[b, 1] > highs[a, 1] or lows[a, 1] > highs[b, 1]:
+                continue
+            ring_a = coords[offsets[a]:offsets[a + 1]]
+            ring_b = coords[offsets[b]:offsets[b + 1]]
+            if (
+                    np.any(segment_crossings(
+                        edges[offsets[a]:offsets[a + 1]],
+                        edges[offsets[b]:offsets[b + 1]]
+                    )[0]) or
+                    np.any(points_in_polygon(ring_a[:1], ring_b)) or
+                    np.any(points_in_polygon(ring_b[:1], ring_a))
+                ):
+                return True
+    return False
+
+def simplify_outward(coords: np.ndarray, tolerance: float) -> np.ndarray:
+    #Douglas-Peucker restricted to chords that never cut into the obstacle:
+    #a run of vertices is only collapsed when all of them lie inside the
+    #clockwise polygon, so the simplified polygon contains the original.
+    n = len(coords)
+    if n <= 3 or tolerance <= 0:
+        return coords
+    anchor = int(np.lexsort((coords[:, 1], coords[:, 0]))[0])
+    coords = np.roll(coords, -anchor, axis=0)
+    far = int(np.argmax(np.sum((coords - coords[0])**2, axis=1)))
+    closed = np.vstack([coords, coords[:1]])
+
+    keep = np.zeros(n + 1, dtype=bool)
+    keep[[0, far, n]] = True
+    stack = [(0, far), (far, n)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        a, b = closed[i], closed[j]
+        chord = b - a
+        norm = np.hypot(*chord)
+        rel = closed[i + 1:j] - a
+        if norm == 0:
+            dist = -np.hypot(rel[:, 0], rel[:, 1])
+        else:
+            dist = (chord[0]*rel[:, 1] - chord[1]*rel[:, 0])/norm
+        if np.any(dist > 0):
+            k = i + 1 + int(np.argmax(dist))
+        elif np.min(dist) < -tolerance:
+            k = i + 1 + int(np.argmin(dist))
+        else:
+            continue
+        keep[k] = True
+        stack.append((i, k))
+        stack.append((k, j))
+    return closed[:n][keep[:n]]
+
+def prune_vertices(coords: np.ndarray, area_tolerance: float) -> np.ndarray:
+    #Drops collinear vertices and fills concave pockets whose triangle is
+    #smaller than area_tolerance. Both only ever grow the obstacle.
+    coords = coords[np.any(coords != np.roll(coords, 1, axis=0), axis=1)]
+    while len(coords) > 3:
+        crosses = vertex_crosses(coords)
+        removable = (crosses == 0) | (
+            (crosses > 0) & (0.5*crosses <= area_tolerance)
+        )
+        if not np.any(removable):
+            break
+        #Never drop two neighbours at once, their triangles overlap
+        idx = np.flatnonzero(removable)
+        idx = idx[np.r_[True, np.diff(idx) > 1]]
+        if len(idx) > 1 and idx[0] == 0 and idx[-1] == len(coords) - 1:
+            idx = idx[:-1]
+        if len(coords) - len(idx) < 3:
+            idx = idx[:len(coords) - 3]
+        coords = np.delete(coords, idx, axis=0)
+    return coords
+
+def polygon_union(polygons: list) -> list:
+    #Boundary of the union of overlapping clockwise polygons. Edge pieces
+    #inside another polygon are discarded and the rest are chained back into
+    #loops; holes (counter-clockwise loops) are filled.
+    pieces = []
+    for a, coords in enumerate(polygons):
+        edges = np.hstack([coords, np.roll(coords, -1, axis=0)])
+        splits = [[] for _ in range(len(edges))]
+        for b, other in enumerate(polygons):
+            if a == b:
+                continue
+            other_edges = np.hstack([other, np.roll(other, -1, axis=0)])
+            lo = min(a, b)
+            first = edges if a < b else other_edges
+            second = other_edges if a < b else edges
+            mask, t, _ = segment_crossings(first, second)
+            for i, j in zip(*np.nonzero(mask)):
+                #Computed from the same pair either way so both sides share it
+                p = first[i, :2] + t[i, j]*(first[i, 2:] - first[i, :2])
+                point = (float(p[0]), float(p[1]))
+                splits[i if a == lo else j].append(point)
+        for k, edge in enumerate(edges):
+            start = (float(edge[0]), float(edge[1]))
+            end = (float(edge[2]), float(edge[3]))
+            inner = sorted(
+                set(splits[k]),
+                key=lambda pt: (pt[0] - start[0])**2 + (pt[1] - start[1])**2
+            )
+            chain = [start] + inner + [end]
+            pieces.extend(
+                (a, chain[m], chain[m + 1]) for m in range(len(chain) - 1)
+            )
+
+    mids = np.array([
+        [(p[0] + q[0])/2, (p[1] + q[1])/2] for _, p, q in pieces
+    ])
+    inside = np.zeros(len(pieces), dtype=bool)
+    owners = np.array([owner for owner, _, _ in pieces])
+    for b, other in enumerate(polygons):
+        candidates = owners != b
+        inside[candidates] |= points_in_polygon(mids[candidates], other)
+
+    outgoing = {}
+    for (_, p, q), dropped in zip(pieces, inside):
+        if not dropped:
+            outgoing.setdefault(p, []).append(q)
+
+    loops = []
+    while outgoing:
+        first = next(iter(outgoing))
+        loop = [first]
+        current = first
+        while True:
+            targets = outgoing.get(current)
+            if not targets:
+                return None
+            nxt = targets.pop()
+            if not targets:
+                del outgoing[current]
+            if nxt == first:
+                break
+            loop.append(nxt)
+            current = nxt
+        loop = np.array(loop)
+        if len(loop) >= 3 and signed_area(loop) < 0:
+            loops.append(loop)
+    return loops
@@ -0,0 +1,392 @@
+import hashlib
+import heapq
+import json
+import os
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from scene.scenes import Point
+from scene.profiler import profiler
+from shapes import Path
+from scene_file import SceneData, load_scene
+from raster import load_grid, raster_polygons
+from geometry import (
+    neighbour_indices,
+    polygon_ids,
+    polygon_vertex_crosses,
+    polygons_overlap
+)
+from visibility import visible_rows
+import kernels
+
+MANIFEST = "manifest.json"
+#Candidate vertex pairs handled per block, bounds the memory of a block
+PAIRS_PER_BLOCK = 1 << 22
+EDGE = np.dtype([("i", "<i8"), ("j", "<i8"), ("w", "<f8")])
+
+
+def scene_digest(data: SceneData) -> str:
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(data.offsets, dtype="<i8").tobytes())
+    for a in range(0, data.n_points, 1 << 20):
+        chunk = np.ascontiguousarray(data.coords[a:a + (1 << 20)], dtype="<f8")
+        digest.update(chunk.tobytes())
+    return digest.hexdigest()
+
+
+def block_bounds(n_vertices: int, pairs_per_block: int) -> list:
+    #Row ranges with about pairs_per_block lower triangle pairs each
+    rows = np.arange(n_vertices + 1, dtype=np.int64)
+    pairs = rows*(rows - 1)//2
+    targets = np.arange(0, pairs[-1] + pairs_per_block, pairs_per_block)
+    cuts = np.unique(np.r_[np.searchsorted(pairs, targets), n_vertices])
+    cuts = cuts[cuts <= n_vertices]
+    return [[int(a), int(b)] for a, b in zip(cuts[:-1], cuts[1:]) if b > a]
+
+
+def write_json(path: str, data: dict) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+class GraphBuilder:
+    #Builds the static visibility graph of a scene without the dense matrix.
+    #Vertex rows are processed in blocks whose surviving edges are written to
+    #disk as soon as they are done; the manifest records finished blocks so
+    #an interrupted build resumes where it stopped. The edge lists are then
+    #turned into a CSR graph on memmapped arrays.
+    def __init__(
+            self,
+            data: SceneData,
+            directory: str,
+            reduced: bool = False,
+            pairs_per_block: int = PAIRS_PER_BLOCK
+        ) -> None:
+        self.data = data
+        self.directory = directory
+        self.reduced = reduced
+        self.pairs_per_block = pairs_per_block
+        self.coords = np.asarray(data.coords)
+        self.prev, self.nxt = neighbour_indices(np.asarray(data.offsets))
+        self.edges = data.edge_array()
+        self.polygon_ids = polygon_ids(np.asarray(data.offsets))
+        if reduced:
+            crosses = polygon_vertex_crosses(self.coords, data.offsets)
+            self.vertex_ids = np.flatnonzero(~(crosses > 0))
+        else:
+            self.vertex_ids = np.arange(data.n_points)
+        self.n_vertices = len(self.vertex_ids)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def load_manifest(self) -> dict:
+        manifest = {
+            "scene": scene_digest(self.data),
+            "reduced": self.reduced,
+            "n_vertices": self.n_vertices,
+            "blocks": block_bounds(self.n_vertices, self.pairs_per_block),
+            "done": [],
+            "csr": False
+        }
+        path = self.path(MANIFEST)
+        if os.path.exists(path):
+            with open(path) as f:
+                previous = json.load(f)
+            keys = ("scene", "reduced", "n_vertices", "blocks")
+            if all(previous[key] == manifest[key] for key in keys):
+                return previous
+            print("Scene or settings changed, starting over")
+        return manifest
+
+    def run(self) -> "GraphStore":
+        os.makedirs(self.path("blocks"), exist_ok=True)
+        manifest = self.load_manifest()
+        if not manifest["done"]:
+            self.data.save(self.path("scene.vgs"))
+        np.save(self.path("vertex_ids.npy"), self.vertex_ids)
+        write_json(self.path(MANIFEST), manifest)
+
+        done = set(manifest["done"])
+        for k, (first, last) in enumerate(manifest["blocks"]):
+            if k in done:
+                continue
+            tic = time.perf_counter()
+            with profiler.stage("store_block"):
+                edges = self.block_edges(first, last)
+            tmp = self.path(f"blocks/{k:06d}.tmp.npy")
+            np.save(tmp, edges)
+            os.replace(tmp, self.path(f"blocks/{k:06d}.npy"))
+            manifest["done"].append(k)
+            write_json(self.path(MANIFEST), manifest)
+            print(f"block {k + 1}/{len(manifest['blocks'])}: rows "
+                  f"{first}-{last}, {len(edges)} edges, "
+                  f"{1000*(time.perf_counter() - tic):.1f} ms")
+
+        if not manifest["csr"]:
+            with profiler.stage("store_csr"):
+                self.write_csr(len(manifest["blocks"]))
+            manifest["csr"] = True
+            write_json(self.path(MANIFEST), manifest)
+            for k in range(len(manifest["blocks"])):
+                os.remove(self.path(f"blocks/{k:06d}.npy"))
+        return GraphStore(self.directory)
+
+    def block_edges(self, first: int, last: int) -> np.ndarray:
+        #Same rows as VisibilityGraphPlanner.link_vertices restricted to
+        #first <= i < last, kept edges only
+        rows = kernels.backend.vertex_rows(
+            self.coords,
+            self.prev,
+            self.nxt,
+            self.polygon_ids,
+            self.vertex_ids,
+            self.edges,
+            first,
+            last,
+            self.reduced
+        )
+        i, j = np.nonzero(rows > 0)
+        edges = np.empty(len(i), dtype=EDGE)
+        edges["i"] = i + first
+        edges["j"] = j
+        edges["w"] = rows[i, j]
+        return edges
+
+    def write_csr(self, n_blocks: int) -> None:
+        #Both directions of every edge, neighbours of a vertex contiguous.
+        #Two passes over the blocks: degrees, then a scatter with one write
+        #cursor per vertex.
+        n = self.n_vertices
+        indptr = np.lib.format.open_memmap(
+            self.path("indptr.npy"), mode="w+", dtype="<i8", shape=(n + 1,)
+        )
+        indptr[:] = 0
+        for k in range(n_blocks):
+            edges = np.load(self.path(f"blocks/{k:06d}.npy"), mmap_mode="r")
+            indptr[1:] += np.bincount(edges["i"], minlength=n)
+            indptr[1:] += np.bincount(edges["j"], minlength=n)
+        np.cumsum(indptr, out=indptr)
+        n_edges = int(indptr[-1])
+
+        indices = np.lib.format.open_memmap(
+            self.path("indices.npy"), mode="w+", dtype="<i8", shape=(n_edges,)
+        )
+        weights = np.lib.format.open_memmap(
+            self.path("weights.npy"), mode="w+", dtype="<f8", shape=(n_edges,)
+        )
+        cursor = np.lib.format.open_memmap(
+            self.path("cursor.npy"), mode="w+", dtype="<i8", shape=(n,)
+        )
+        cursor[:] = indptr[:-1]
+        for k in range(n_blocks):
+            edges = np.load(self.path(f"blocks/{k:06d}.npy"))
+            nodes = np.r_[edges["i"], edges["j"]]
+            neighbours = np.r_[edges["j"], edges["i"]]
+            order = np.argsort(nodes, kind="stable")
+            nodes = nodes[order]
+            firsts = np.r_[0, np.flatnonzero(np.diff(nodes)) + 1]
+            counts = np.diff(np.r_[firsts, len(nodes)])
+            rank = np.arange(len(nodes)) - np.repeat(firsts, counts)
+            slots = cursor[nodes] + rank
+            indices[slots] = neighbours[order]
+            weights[slots] = np.r_[edges["w"], edges["w"]][order]
+            cursor[nodes[firsts]] += counts
+        indptr.flush()
+        indices.flush()
+        weights.flush()
+        del cursor
+        os.remove(self.path("cursor.npy"))
+
+
+class GraphStore:
+    #Memmapped CSR graph written by GraphBuilder. Queries link start and goal
+    #like the planner does and run A* reading only the rows they expand.
+    def __init__(self, directory: str) -> None:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        if not self.manifest["csr"]:
+            raise RuntimeError(f"{directory} has an unfinished build")
+        self.reduced = self.manifest["reduced"]
+        self.data = SceneData.load(os.path.join(directory, "scene.vgs"))
+        self.coords = np.asarray(self.data.coords)
+        self.prev, self.nxt = neighbour_indices(np.asarray(self.data.offsets))
+        self.edges = self.data.edge_array()
+        load = lambda name: np.load(os.path.join(directory, name), mmap_mode="r")
+        self.vertex_ids = load("vertex_ids.npy")
+        self.indptr = load("indptr.npy")
+        self.indices = load("indices.npy")
+        self.weights = load("weights.npy")
+        self.vertex_array = self.coords[self.vertex_ids]
+        self.n_vertices = len(self.vertex_ids)
+        self.overlapping = polygons_overlap(self.coords, self.data.offsets)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.indices)//2
+
+    def link(self, point: Point) -> tuple:
+        #Visible vertices of point and their distances, the same rows as
+        #VisibilityGraphPlanner.link_rows so both find the same paths
+        with profiler.stage("store_link"):
+            rows = visible_rows(
+                [point.x, point.y],
+                self.coords,
+                self.data.offsets,
+                self.vertex_ids,
+                self.edges,
+                self.overlapping
+            )[0]
+            ids = np.flatnonzero(rows > 0)
+            if self.reduced:
+                tangent = kernels.backend.tangent_mask(
+                    np.broadcast_to([point.x, point.y], (len(ids), 2)),
+                    self.vertex_ids[ids],
+                    self.coords,
+                    self.prev,
+                    self.nxt
+                )
+                ids = ids[tangent]
+        return ids, rows[ids]
+
+    def plan(self, start: Point, goal: Point) -> Path:
+        #A* over the vertices, start is node n_vertices and goal n_vertices+1
+        start_ids, start_w = self.link(start)
+        goal_ids, goal_w = self.link(goal)
+        n = self.n_vertices
+        s, g = n, n + 1
+        to_goal = dict(zip(goal_ids.tolist(), goal_w.tolist()))
+        gx, gy = goal.x, goal.y
+
+        with profiler.stage("store_astar"):
+            best = {s: 0.0}
+            parent = {s: None}
+            heap = [(0.0, s)]
+            direct = kernels.backend.segments_free(
+                np.array([[start.x, start.y, gx, gy]]),
+                self.edges
+            )[0]
+            if direct:
+                cost = ((start.x - gx)**2 + (start.y - gy)**2)**0.5
+                best[g] = cost
+                parent[g] = s
+                heapq.heappush(heap, (cost, g))
+            closed = set()
+            expanded = 0
+            while heap:
+                _, u = heapq.heappop(heap)
+                if u in closed:
+                    continue
+                if u == g:
+                    break
+                closed.add(u)
+                expanded += 1
+                if u == s:
+                    nbrs, ws = start_ids, start_w
+                else:
+                    a, b = self.indptr[u], self.indptr[u + 1]
+                    nbrs, ws = np.asarray(self.indices[a:b]), self.weights[a:b]
+                cost = best[u] + np.asarray(ws)
+                heuristic = np.hypot(
+                    self.vertex_array[nbrs, 0] - gx,
+                    self.vertex_array[nbrs, 1] - gy
+                )
+                for v, c, h in zip(nbrs.tolist(), cost.tolist(), heuristic.tolist()):
+                    if c < best.get(v, np.inf):
+                        best[v] = c
+                        parent[v] = u
+                        heapq.heappush(heap, (c + h, v))
+                if u in to_goal:
+                    c = best[u] + to_goal[u]
+                    if c < best.get(g, np.inf):
+                        best[g] = c
+                        parent[g] = u
+                        heapq.heappush(heap, (c, g))
+            profiler.count("astar_expanded", expanded)
+
+        if g not in parent:
+            raise ValueError("No path exists.")
+        points = []
+        node = g
+        while node is not None:
+            if node == g:
+                points.append(goal)
+            elif node == s:
+                points.append(start)
+            else:
+                points.append(Point(*self.vertex_array[node].tolist()))
+            node = parent[node]
+        return Path(points)
+
+
+def parse_args() -> object:
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--kernels",
+        default = "auto",
+        choices = ("auto",) + kernels.BACKENDS,
+        help = "Núcleos geométricos; auto usa numba si está instalado"
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Construye el grafo en disco")
+    build.add_argument("source", type=str, help="Escena, .wkt, .geojson o mapa")
+    build.add_argument("directory", type=str, help="Carpeta del grafo")
+    build.add_argument(
+        "--reduced",
+        action = "store_true",
+        help = "Solo vértices convexos y aristas bitangentes"
+    )
+    build.add_argument(
+        "--pairs-per-block",
+        default = PAIRS_PER_BLOCK,
+        type = int,
+        help = "Pares de vértices por bloque, acota la memoria"
+    )
+    build.add_argument(
+        "--map-tolerance",
+        default = 1.5,
+        type = float,
+        help = "Tolerancia en píxeles al simplificar los contornos del mapa"
+    )
+
+    query = sub.add_parser("query", help="Consulta rutas sobre el grafo")
+    query.add_argument("directory", type=str, help="Carpeta del grafo")
+    query.add_argument("points", type=float, nargs=4, help="x0 y0 x1 y1")
+
+    args = parser.parse_args()
+    return args
+
+def main() -> None:
+    args = parse_args()
+    kernels.use(args.kernels)
+    if args.command == "build":
+        extension = os.path.splitext(args.source)[1].lower()
+        if extension in (".png", ".jpg", ".jpeg", ".bmp", ".pgm", ".npy"):
+            polygons = raster_polygons(load_grid(args.source), args.map_tolerance)
+            data = SceneData.from_polygons(polygons)
+        else:
+            data = load_scene(args.source)
+        tic = time.perf_counter()
+        store = GraphBuilder(
+            data,
+            args.directory,
+            reduced = args.reduced,
+            pairs_per_block = args.pairs_per_block
+        ).run()
+        print(f"{store.n_vertices} vertices, {store.n_edges} edges in "
+              f"{time.perf_counter() - tic:.2f} s")
+    else:
+        store = GraphStore(args.directory)
+        x0, y0, x1, y1 = args.points
+        tic = time.perf_counter()
+        path = store.plan(Point(x0, y0), Point(x1, y1))
+        print(f"{1000*(time.perf_counter() - tic):.2f} ms: {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,412 @@
+import math
+import os
+
+import numpy as np
+
+from scene.profiler import profiler
+from geometry import (
+    inner_diagonals,
+    tangent_mask,
+    segments_free,
+    segment_lengths
+)
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKENDS = ("numpy", "numba")
+
+if numba is not None:
+    jit = numba.njit(cache=True)
+else:
+    def jit(function: object) -> object:
+        return function
+
+
+class NumpyKernels:
+    #Vectorized predicates from geometry.py, the reference every other
+    #backend has to match bit for bit
+    name = "numpy"
+
+    def segments_free(self, segments: np.ndarray, edges: np.ndarray) -> np.ndarray:
+        return segments_free(segments, edges)
+
+    def inner_diagonals(
+            self,
+            coords: np.ndarray,
+            prev: np.ndarray,
+            nxt: np.ndarray,
+            i: int,
+            js: np.ndarray
+        ) -> np.ndarray:
+        return inner_diagonals(coords, prev, nxt, i, js)
+
+    def tangent_mask(
+            self,
+            points: np.ndarray,
+            goals: np.ndarray,
+            coords: np.ndarray,
+            prev: np.ndarray,
+            nxt: np.ndarray
+        ) -> np.ndarray:
+        return tangent_mask(points, goals, coords, prev, nxt)
+
+    def vertex_rows(
+            self,
+            coords: np.ndarray,
+            prev: np.ndarray,
+            nxt: np.ndarray,
+            polygon_ids: np.ndarray,
+            vertex_ids: np.ndarray,
+            edges: np.ndarray,
+            first: int,
+            last: int,
+            reduced: bool = False
+        ) -> np.ndarray:
+        #Static graph rows first <= i < last: length to every earlier vertex
+        #or -1 when blocked, an inner diagonal or (reduced) not bitangent.
+        #vertex_ids maps graph vertices to rows of coords.
+        rows = np.full((last - first, last), -1.0)
+        for i in range(first, last):
+            vi = vertex_ids[i]
+            js = np.arange(i)
+            vjs = vertex_ids[js]
+            same = polygon_ids[vjs] == polygon_ids[vi]
+            if reduced:
+                point = np.broadcast_to(coords[vi], (i, 2))
+                bitangent = (
+                    self.tangent_mask(point, vjs, coords, prev, nxt) &
+                    self.tangent_mask(
+                        coords[vjs],
+                        np.full(i, vi),
+                        coords,
+                        prev,
+                        nxt
+                    )
+                )
+                keep = same | bitangent
+                js, vjs, same = js[keep], vjs[keep], same[keep]
+            if not len(js):
+                continue
+            segments = np.empty((len(js), 4))
+            segments[:, :2] = coords[vi]
+            segments[:, 2:] = coords[vjs]
+            free = self.segments_free(segments, edges)
+            free[same] &= ~self.inner_diagonals(coords, prev, nxt, vi, vjs[same])
+            rows[i - first, js[free]] = segment_lengths(segments[free])
+        return rows
+
+
+@jit
+def opposite(a: float, b: float) -> bool:
+    return (a > 0 and b < 0) or (a < 0 and b > 0)
+
+@jit
+def enters_corner(
+        px: float,
+        py: float,
+        vx: float,
+        vy: float,
+        nx: float,
+        ny: float,
+        dx: float,
+        dy: float,
+        sign: float
+    ) -> bool:
+    #Corner p, v, n; sign 1 for the ray along (dx, dy), -1 against it
+    in_x = vx - px
+    in_y = vy - py
+    out_x = nx - vx
+    out_y = ny - vy
+    c_in = sign*(in_x*dy - in_y*dx)
+    c_out = sign*(out_x*dy - out_y*dx)
+    if in_x*out_y - in_y*out_x < 0:
+        return c_in < 0 and c_out < 0
+    return c_in < 0 or c_out < 0
+
+@jit
+def vertex_blocks(
+        along: float,
+        dx: float,
+        dy: float,
+        px: float,
+        py: float,
+        vx: float,
+        vy: float,
+        nx: float,
+        ny: float
+    ) -> bool:
+    #Corner p, v, n with v on the segment line, along its projection
+    length = dx*dx + dy*dy
+    return (
+        (0 <= along and along < length and
+         enters_corner(px, py, vx, vy, nx, ny, dx, dy, 1.0)) or
+        (0 < along and along <= length and
+         enters_corner(px, py, vx, vy, nx, ny, dx, dy, -1.0))
+    )
+
+@jit
+def segment_blocked(
+        x1: float,
+        y1: float,
+        x2: float,
+        y2: float,
+        edge: np.ndarray
+    ) -> bool:
+    #geometry.segments_blocked for one pair, same operations in the same order
+    dx = x2 - x1
+    dy = y2 - y1
+    ax = edge[0] - x1
+    ay = edge[1] - y1
+    bx = edge[2] - x1
+    by = edge[3] - y1
+    ex = edge[2] - edge[0]
+    ey = edge[3] - edge[1]
+    x2a = x2 - edge[0]
+    y2a = y2 - edge[1]
+    side_a = dx*ay - dy*ax
+    side_b = dx*by - dy*bx
+    side_1 = ex*ay - ey*ax
+    side_2 = ey*x2a - ex*y2a
+    if opposite(side_a, side_b) and opposite(side_1, side_2):
+        return True
+    if side_a == 0 and vertex_blocks(
+            ax*dx + ay*dy, dx, dy,
+            edge[4], edge[5], edge[0], edge[1], edge[2], edge[3]
+        ):
+        return True
+    return side_b == 0 and vertex_blocks(
+        bx*dx + by*dy, dx, dy,
+        edge[0], edge[1], edge[2], edge[3], edge[6], edge[7]
+    )
+
+@jit
+def segment_free(
+        x1: float,
+        y1: float,
+        x2: float,
+        y2: float,
+        edges: np.ndarray
+    ) -> bool:
+    #Stops at the first blocking edge
+    for e in range(edges.shape[0]):
+        if segment_blocked(x1, y1, x2, y2, edges[e]):
+            return False
+    return True
+
+@jit
+def inner_diagonal(
+        coords: np.ndarray,
+        prev: np.ndarray,
+        nxt: np.ndarray,
+        i: int,
+        j: int
+    ) -> bool:
+    x, y = coords[i, 0], coords[i, 1]
+    angle = math.atan2(coords[j, 1] - y, coords[j, 0] - x)
+    prev_angle = math.atan2(coords[nxt[i], 1] - y, coords[nxt[i], 0] - x)
+    next_to_angle = math.atan2(coords[prev[i], 1] - y, coords[prev[i], 0] - x)
+    if angle < next_to_angle:
+        angle += 2*math.pi
+    if prev_angle < next_to_angle:
+        prev_angle += 2*math.pi
+    return next_to_angle < angle and angle < prev_angle
+
+@jit
+def tangent(
+        x: float,
+        y: float,
+        goal: int,
+        coords: np.ndarray,
+        prev: np.ndarray,
+        nxt: np.ndarray
+    ) -> bool:
+    gx, gy = coords[goal, 0], coords[goal, 1]
+    dy = gy - y
+    dx = gx - x
+    prev_cross = (
+        dy*(coords[nxt[goal], 0] - gx) -
+        dx*(coords[nxt[goal], 1] - gy)
+    )
+    next_cross = (
+        dy*(coords[prev[goal], 0] - gx) -
+        dx*(coords[prev[goal], 1] - gy)
+    )
+    return prev_cross*next_cross > 0
+
+@jit
+def fill_segments_free(segments: np.ndarray, edges: np.ndarray, out: np.ndarray) -> None:
+    for k in range(segments.shape[0]):
+        out[k] = segment_free(
+            segments[k, 0], segments[k, 1], segments[k, 2], segments[k, 3],
+            edges
+        )
+
+@jit
+def fill_inner_diagonals(
+        coords: np.ndarray,
+        prev: np.ndarray,
+        nxt: np.ndarray,
+        i: int,
+        js: np.ndarray,
+        out: np.ndarray
+    ) -> None:
+    for k in range(js.shape[0]):
+        out[k] = inner_diagonal(coords, prev, nxt, i, js[k])
+
+@jit
+def fill_tangent_mask(
+        points: np.ndarray,
+        goals: np.ndarray,
+        coords: np.ndarray,
+        prev: np.ndarray,
+        nxt: np.ndarray,
+        out: np.ndarray
+    ) -> None:
+    for k in range(goals.shape[0]):
+        out[k] = tangent(points[k, 0], points[k, 1], goals[k], coords, prev, nxt)
+
+@jit
+def fill_vertex_rows(
+        coords: np.ndarray,
+        prev: np.ndarray,
+        nxt: np.ndarray,
+        polygon_ids: np.ndarray,
+        vertex_ids: np.ndarray,
+        edges: np.ndarray,
+        first: int,
+        reduced: bool,
+        rows: np.ndarray
+    ) -> int:
+    #Cheapest test first: bitangency, inner diagonal, then the edge scan.
+    #Returns how many segments reached the edge scan.
+    scanned = 0
+    for i in range(first, first + rows.shape[0]):
+        vi = vertex_ids[i]
+        x, y = coords[vi, 0], coords[vi, 1]
+        for j in range(i):
+            vj = vertex_ids[j]
+            gx, gy = coords[vj, 0], coords[vj, 1]
+            same = polygon_ids[vj] == polygon_ids[vi]
+            if reduced and not same and not (
+                tangent(x, y, vj, coords, prev, nxt) and
+                tangent(gx, gy, vi, coords, prev, nxt)
+            ):
+                continue
+            if same and inner_diagonal(coords, prev, nxt, vi, vj):
+                continue
+            scanned += 1
+            if segment_free(x, y, gx, gy, edges):
+                dx, dy = x - gx, y - gy
+                rows[i - first, j] = math.sqrt(dx*dx + dy*dy)
+    return scanned
+
+
+class NumbaKernels(NumpyKernels):
+    #Scalar loops compiled with numba. They skip the (segments, edges)
+    #temporaries and stop scanning edges at the first hit.
+    name = "numba"
+
+    def segments_free(self, segments: np.ndarray, edges: np.ndarray) -> np.ndarray:
+        free = np.ones(len(segments), dtype=bool)
+        if len(edges) == 0:
+            return free
+        profiler.count("intersection_tests", len(segments)*len(edges))
+        fill_segments_free(as_float(segments), as_float(edges), free)
+        return free
+
+    def inner_diagonals(
+            self,
+            coords: np.ndarray,
+            prev: np.ndarray,
+            nxt: np.ndarray,
+            i: int,
+            js: np.ndarray
+        ) -> np.ndarray:
+        out = np.empty(len(js), dtype=bool)
+        fill_inner_diagonals(
+            as_float(coords),
+            as_int(prev),
+            as_int(nxt),
+            int(i),
+            as_int(js),
+            out
+        )
+        return out
+
+    def tangent_mask(
+            self,
+            points: np.ndarray,
+            goals: np.ndarray,
+            coords: np.ndarray,
+            prev: np.ndarray,
+            nxt: np.ndarray
+        ) -> np.ndarray:
+        out = np.empty(len(goals), dtype=bool)
+        fill_tangent_mask(
+            as_float(points),
+            as_int(goals),
+            as_float(coords),
+            as_int(prev),
+            as_int(nxt),
+            out
+        )
+        return out
+
+    def vertex_rows(
+            self,
+            coords: np.ndarray,
+            prev: np.ndarray,
+            nxt: np.ndarray,
+            polygon_ids: np.ndarray,
+            vertex_ids: np.ndarray,
+            edges: np.ndarray,
+            first: int,
+            last: int,
+            reduced: bool = False
+        ) -> np.ndarray:
+        rows = np.full((last - first, last), -1.0)
+        scanned = fill_vertex_rows(
+            as_float(coords),
+            as_int(prev),
+            as_int(nxt),
+            as_int(polygon_ids),
+            as_int(vertex_ids),
+            as_float(edges),
+            int(first),
+            bool(reduced),
+            rows
+        )
+        #Same unit as segments_free: segments times edges, early exits aside
+        profiler.count("intersection_tests", scanned*len(edges))
+        return rows
+
+
+def as_float(array: np.ndarray) -> np.ndarray:
+    return np.ascontiguousarray(array, dtype=np.float64)
+
+def as_int(array: np.ndarray) -> np.ndarray:
+    return np.ascontiguousarray(array, dtype=np.int64)
+
+def available() -> list:
+    return [name for name in BACKENDS if name != "numba" or numba is not None]
+
+def use(name: str = "auto") -> NumpyKernels:
+    #Picks the backend every planner uses from now on. auto prefers numba
+    #when it is installed; asking for numba without it is an error.
+    global backend
+    if name == "auto":
+        name = "numba" if numba is not None else "numpy"
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown kernel backend {name!r}, use one of {BACKENDS}")
+    if name == "numba" and numba is None:
+        raise RuntimeError("The numba backend needs numba: pip install numba")
+    if name == "numba":
+        backend = NumbaKernels()
+    else:
+        backend = NumpyKernels()
+    return backend
+
+backend = use(os.environ.get("VISIBILITY_KERNELS", "auto"))
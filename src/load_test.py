@@ -0,0 +1,109 @@
+import asyncio
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from scene.server import request
+
+
+def parse_args() -> object:
+    parser = ArgumentParser()
+
+    parser.add_argument(
+        "--host",
+        default = "127.0.0.1",
+        type = str,
+        help = "Dirección del servicio"
+    )
+    parser.add_argument(
+        "--port",
+        default = 8000,
+        type = int,
+        help = "Puerto del servicio"
+    )
+    parser.add_argument(
+        "--clients",
+        default = 32,
+        type = int,
+        help = "Conexiones concurrentes"
+    )
+    parser.add_argument(
+        "--requests",
+        default = 1000,
+        type = int,
+        help = "Peticiones totales"
+    )
+    parser.add_argument(
+        "--batch",
+        default = 1,
+        type = int,
+        help = "Consultas por petición"
+    )
+    parser.add_argument(
+        "--seed",
+        default = 0,
+        type = int,
+        help = "Semilla de los puntos aleatorios"
+    )
+
+    args = parser.parse_args()
+    return args
+
+async def client(args: object, jobs: asyncio.Queue, latencies: list) -> int:
+    #One keep-alive connection sending requests until the queue is empty
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    errors = 0
+    try:
+        while not jobs.empty():
+            queries = jobs.get_nowait()
+            tic = time.perf_counter()
+            status, _ = await request(
+                reader,
+                writer,
+                "POST",
+                "/paths",
+                {"queries": queries}
+            )
+            latencies.append(time.perf_counter() - tic)
+            errors += status != 200
+    finally:
+        writer.close()
+    return errors
+
+async def run(args: object) -> None:
+    rng = np.random.default_rng(args.seed)
+    points = rng.uniform(-1, 1, (args.requests, args.batch, 4)).tolist()
+    jobs = asyncio.Queue()
+    for batch in points:
+        jobs.put_nowait([
+            {"start": query[:2], "goal": query[2:]} for query in batch
+        ])
+
+    latencies = []
+    tic = time.perf_counter()
+    errors = await asyncio.gather(*[
+        client(args, jobs, latencies) for _ in range(args.clients)
+    ])
+    elapsed = time.perf_counter() - tic
+
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    _, metrics = await request(reader, writer, "GET", "/metrics")
+    writer.close()
+
+    latencies = 1000*np.array(latencies)
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+    print(f"{args.requests} requests x {args.batch} queries, "
+          f"{args.clients} clients, {sum(errors)} errors")
+    print(f"  {args.requests/elapsed:10.1f} requests/s")
+    print(f"  {args.requests*args.batch/elapsed:10.1f} queries/s")
+    print(f"  latency p50 {p50:.2f} ms  p90 {p90:.2f} ms  p99 {p99:.2f} ms")
+    print(f"  server mean batch {metrics['mean_batch']:.1f}, "
+          f"{metrics['without_path']} without path")
+
+def main() -> None:
+    asyncio.run(run(parse_args()))
+
+
+if __name__ == '__main__':
+    main()
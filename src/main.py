@@ -1,6 +1,11 @@
 from argparse import ArgumentParser
 
-from polygon_scene import VisibilityGraphScene
+from polygon_scene import VisibilityGraphScene, FleetScene
+from raster import load_grid, raster_polygons
+from scene_file import load_scene
+from scene.profiler import profiler
+from scene.telemetry import Telemetry
+import kernels
 
 def parse_args() -> object:
     parser = ArgumentParser()
@@ -28,26 +33,128 @@ def parse_args() -> object:
         type = int,
         help = "FPS de la simulación"
     )
+    parser.add_argument(
+        "--preprocess",
+        action = "store_true",
+        help = "Simplifica, une y poda los obstáculos antes de construir el grafo"
+    )
+    parser.add_argument(
+        "--tolerance",
+        default = 0.01,
+        type = float,
+        help = "Tolerancia de la simplificación Douglas-Peucker"
+    )
+    parser.add_argument(
+        "--map",
+        default = None,
+        type = str,
+        help = "Imagen o rejilla .npy de ocupación (píxeles oscuros son obstáculos)"
+    )
+    parser.add_argument(
+        "--agents",
+        default = 0,
+        type = int,
+        help = "Simula N robots que comparten el mismo grafo de visibilidad"
+    )
+    parser.add_argument(
+        "--threaded",
+        action = "store_true",
+        help = "Planifica en un hilo aparte para no congelar la ventana"
+    )
+    parser.add_argument(
+        "--scene",
+        default = None,
+        type = str,
+        help = "Escena binaria, .wkt o .geojson (ver src/scene_file.py)"
+    )
+    parser.add_argument(
+        "--profile",
+        default = None,
+        type = str,
+        help = "Muestra tiempos por etapa y los guarda en JSON al salir"
+    )
+    parser.add_argument(
+        "--trace",
+        default = None,
+        type = str,
+        help = "Guarda una traza para chrome://tracing al salir"
+    )
+    parser.add_argument(
+        "--profile-allocations",
+        action = "store_true",
+        help = "Mide también la memoria reservada por cuadro (más lento)"
+    )
+    parser.add_argument(
+        "--telemetry",
+        default = None,
+        type = str,
+        help = "Envía el estado por cuadro a un archivo, unix:/ruta o tcp:host:puerto"
+    )
+    parser.add_argument(
+        "--map-tolerance",
+        default = 1.5,
+        type = float,
+        help = "Tolerancia en píxeles al simplificar los contornos del mapa"
+    )
+    parser.add_argument(
+        "--kernels",
+        default = "auto",
+        choices = ("auto",) + kernels.BACKENDS,
+        help = "Núcleos geométricos; auto usa numba si está instalado"
+    )
 
     args = parser.parse_args()
     return args
 
 def main() -> None:
     args = parse_args()
+    kernels.use(args.kernels)
 
     if args.complete:
         title = "Visibility Graph"
     else:
         title = "Reduced Visibility Graph"
 
-    scene = VisibilityGraphScene(
+    if args.profile or args.trace:
+        profiler.enable(allocations = args.profile_allocations)
+
+    scene_kwargs = {}
+    if args.map is not None:
+        grid = load_grid(args.map)
+        scene_kwargs["polygons"] = raster_polygons(grid, args.map_tolerance)
+    if args.scene is not None:
+        scene_kwargs["scene_data"] = load_scene(args.scene)
+
+    if args.agents > 0:
+        scene_cls = FleetScene
+        scene_kwargs["agents"] = args.agents
+        title = f"{title} ({args.agents} agents)"
+    else:
+        scene_cls = VisibilityGraphScene
+
+    scene = scene_cls(
         title = title,
         width = args.width,
         height = args.height,
         max_fps = args.fps,
-        complete = args.complete
+        complete = args.complete,
+        preprocess = args.preprocess,
+        tolerance = args.tolerance,
+        threaded = args.threaded,
+        **scene_kwargs
     )
-    scene.run()
+    if args.telemetry is not None:
+        scene.telemetry = Telemetry(args.telemetry)
+        scene.telemetry.launch()
+    try:
+        scene.run()
+    finally:
+        if scene.telemetry is not None:
+            scene.telemetry.close()
+        if args.profile is not None:
+            profiler.export_json(args.profile)
+        if args.trace is not None:
+            profiler.export_chrome_trace(args.trace)
 
 
 if __name__ == '__main__':
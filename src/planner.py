@@ -1,15 +1,53 @@
-import sys
-
 import numpy as np
-from scipy.sparse import csr_array
+from scipy.sparse import coo_array, csr_array
 from scipy.sparse.csgraph import dijkstra
 
 from scene.scenes import Point, GLScene
+from scene.profiler import profiler
 from shapes import Segment, Polygon, Path
+from scene_file import SceneData
+from visibility import visibility_polygons, visible_rows
+from geometry import (
+    neighbour_indices,
+    polygon_ids,
+    polygon_vertex_crosses,
+    polygons_overlap,
+    signed_area,
+    segment_lengths,
+    PAIRS_PER_CHUNK
+)
+import kernels
+
+
+class PlanResult:
+    #Consistent copy of what changes with start and goal, safe to read
+    #while the planner keeps working on the next request
+    def __init__(
+            self,
+            start: Point,
+            goal: Point,
+            start_edges: np.ndarray,
+            goal_edges: np.ndarray,
+            shortest_path: Path
+        ) -> None:
+        self.start = start
+        self.goal = goal
+        self.start_edges = start_edges
+        self.goal_edges = goal_edges
+        self.shortest_path = shortest_path
 
-EPS = sys.float_info.epsilon
+    @property
+    def start_goal_edge(self) -> float:
+        return self.goal_edges[-1]
 
 class VisibilityGraphPlanner:
+    #Complete graph over every obstacle vertex, concave ones included. It is
+    #the unfiltered reference the reduced planner is compared against;
+    #concave vertices never lie on a shortest path and only cost time here.
+
+    #Static rows also drop edges that are not bitangent
+    reduced = False
+
     def __init__(
             self,
             scene: GLScene,
@@ -21,9 +59,7 @@ class VisibilityGraphPlanner:
         self.scene = scene
         self._start = start
         self._goal = goal
-        self.vertices = self.get_vertices()
-        self.n_vertices = len(self.vertices)
-        self.graph = np.zeros((self.n_vertices + 2, self.n_vertices + 2))
+        self.load_arrays()
         self.reset_static_graph()
         self.shortest_path = self.get_shortest_path()
 
@@ -38,21 +74,15 @@ class VisibilityGraphPlanner:
         self.shortest_path = self.get_shortest_path()
 
     def _update_start_edges(self) -> None:
-        start_idx = self.n_vertices
-        #Start to polygons' vertices
-        for j, vertex in enumerate(self.vertices):
-            segment = Segment(self._start, vertex)
+        with profiler.stage("link_start"):
+            #Start to polygons' vertices, from its visibility polygon
+            self.start_edges = self.link_rows([self._start.x, self._start.y])[0]
+
+            segment = Segment(self._start, self._goal)
             if self.is_segment_free(segment):
-                self.graph[start_idx][j] = segment.len()
+                self.goal_edges[-1] = segment.len()
             else:
-                self.graph[start_idx][j] = -1
-        
-        goal_idx = start_idx + 1
-        segment = Segment(self._start, self._goal)
-        if self.is_segment_free(segment):
-            self.graph[goal_idx][start_idx] = segment.len()
-        else:
-            self.graph[goal_idx][start_idx] = -1
+                self.goal_edges[-1] = -1
 
     @property
     def goal(self) -> Point:
@@ -65,121 +95,147 @@ class VisibilityGraphPlanner:
         self.shortest_path = self.get_shortest_path()
 
     def _update_goal_edges(self) -> None:
-        goal_idx = self.n_vertices + 1
+        with profiler.stage("link_goal"):
+            #Goal to all other vertices, the start last
+            targets = np.vstack([
+                self.vertex_array,
+                [[self._start.x, self._start.y]]
+            ])
+            self.goal_edges = self.link_point(self._goal, targets)
+
+    def link_point(self, point: Point, targets: np.ndarray = None) -> np.ndarray:
+        if targets is None:
+            targets = self.vertex_array
+        segments = np.empty((len(targets), 4))
+        segments[:, :2] = [point.x, point.y]
+        segments[:, 2:] = targets
+        free = kernels.backend.segments_free(segments, self.edge_array)
+        return np.where(free, segment_lengths(segments), -1)
+
+    def visibility(self, points: np.ndarray, bounds: tuple = None) -> tuple:
+        #Visibility polygons of many points and the planner vertices each
+        #one sees, (len(points), n_vertices)
+        polygons, visible = visibility_polygons(
+            points,
+            self.scene_data.coords,
+            self.scene_data.offsets,
+            bounds
+        )
+        return polygons, visible[:, self.get_vertex_mask()]
+
+    def link_rows(self, points: np.ndarray, visible: np.ndarray = None) -> np.ndarray:
+        #Rows of link_point for many points at once, -1 where not visible
+        return visible_rows(
+            points,
+            self.scene_data.coords,
+            self.scene_data.offsets,
+            self.vertex_ids,
+            self.edge_array,
+            self.overlapping,
+            visible
+        )
 
-        #Goal to all other vertices
-        for j, vertex in enumerate(self.vertices + [self._start]):
-            segment = Segment(self._goal, vertex)
-            if self.is_segment_free(segment):
-                self.graph[goal_idx][j] = segment.len()
-            else:
-                self.graph[goal_idx][j] = -1
-
-    def get_vertices(self) -> list:
-        return [
-            vertex
-            for polygon in self.scene.polygons
-            for vertex in polygon.points
-        ]
-
-    def lines_intersect(self, line_1: Segment, line_2: Segment) -> bool:
-        if line_1.points[0] in line_2.points:
-            return False
-        if line_1.points[1] in line_2.points:
-            return False
-    
-        x1, y1 = line_1.points[0].x, line_1.points[0].y
-        x2, y2 = line_1.points[1].x, line_1.points[1].y
-        x3, y3 = line_2.points[0].x, line_2.points[0].y
-        x4, y4 = line_2.points[1].x, line_2.points[1].y
-
-        m1 = (y1 - y2)/(x1 - x2 + EPS)
-        m2 = (y3 - y4)/(x3 - x4 + EPS)
-        if m1 == m2:
-            return False
-
-        b1 = y1 - m1*x1
-        b2 = y3 - m2*x3
-
-        xa = (b2 - b1)/(m1 - m2)
-
-        low_1 = min(x1, x2)
-        high_1 = max(x1, x2)
-
-        if not low_1 - EPS < xa < high_1 + EPS:
-            return False
-        low_2 = min(x3, x4)
-        high_2 = max(x3, x4)
-        if not low_2 - EPS < xa < high_2 + EPS:
-            return False
-        return True
+    def load_arrays(self, data: SceneData = None) -> None:
+        #Array view of the scene: every polygon vertex, obstacle edges and
+        #the polygon each vertex belongs to
+        if data is None:
+            data = getattr(self.scene, "scene_data", None)
+        if data is None:
+            data = SceneData.from_polygons(self.scene.polygons)
+        self.scene_data = data
+        self.edge_array = data.edge_array()
+        mask = self.get_vertex_mask()
+        self.vertex_ids = np.flatnonzero(mask)
+        self.vertex_array = np.asarray(data.coords)[mask]
+        self.n_vertices = len(self.vertex_array)
+        self.polygon_ids = polygon_ids(data.offsets)
+        self.vertex_polygon_ids = self.polygon_ids[mask]
+        self.prev, self.nxt = neighbour_indices(data.offsets)
+        self.overlapping = polygons_overlap(data.coords, data.offsets)
+
+    def get_vertex_mask(self) -> np.ndarray:
+        return np.ones(self.scene_data.n_points, dtype=bool)
 
     def is_segment_free(self, segment: Segment) -> bool:
-        for polygon in self.scene.polygons:
-            n_vertices = len(polygon.points)
-            for i in range(n_vertices):
-                end_a = polygon.points[i]
-                end_b = polygon.points[(i + 1) % n_vertices]
-                edge = Segment(end_a, end_b)
-                if self.lines_intersect(segment, edge):
-                    return False
-        return True
-
-    def get_vertex_polygon(self, vertex: Point) -> Polygon:
-        for polygon in self.scene.polygons:
-            if vertex in polygon.points:
-                return polygon
-        return None
-
-    def is_inner_diagonal(
-            self,
-            start: Point,
-            goal: Point,
-            polygon: Polygon
-        ) -> bool:
-        n_vertices = len(polygon.points)
-        start_idx = polygon.points.index(start)
-        prev_start = polygon.points[(start_idx + 1) % n_vertices]
-        next_to_start = polygon.points[(start_idx - 1) % n_vertices]
-
-        angle = Segment(start, goal).angle
-        prev_angle = Segment(start, prev_start).angle
-        next_to_angle = Segment(start, next_to_start).angle
-
-        while angle < next_to_angle:
-            angle += 2*np.pi
-        while prev_angle < next_to_angle:
-            prev_angle += 2*np.pi
-
-        return next_to_angle < angle < prev_angle
-    
+        start, goal = segment.points
+        segments = np.array([[start.x, start.y, goal.x, goal.y]])
+        return bool(kernels.backend.segments_free(segments, self.edge_array)[0])
+
     def reset_static_graph(self) -> np.ndarray:
-        self.graph = np.zeros((self.n_vertices + 2, self.n_vertices + 2))
-        #Computing graph using polygons only
-        for i in range(1, self.n_vertices):
-            start = self.vertices[i]
-            start_polygon = self.get_vertex_polygon(start)
-            for j in range(i):
-                goal = self.vertices[j]
-                goal_polygon = self.get_vertex_polygon(goal)
-                inner_diagonal = (
-                    start_polygon == goal_polygon and
-                    self.is_inner_diagonal(start, goal, start_polygon)
-                )
-                if inner_diagonal:
-                    self.graph[i][j] = -1
-                    continue
-                segment = Segment(start, goal)
-                if self.is_segment_free(segment):
-                    self.graph[i][j] = segment.len()
-                else:
-                    self.graph[i][j] = -1
-
-        #Start to polygons' vertices
-        self._update_start_edges()
+        with profiler.stage("static_graph"):
+            #Computing graph using polygons only, one block of rows at a time
+            self.static_graph = coo_array((self.n_vertices, self.n_vertices))
+            self.link_vertices(1)
+            self.goal_edges = np.full(self.n_vertices + 1, -1.0)
+
+            #Start to polygons' vertices
+            self._update_start_edges()
+
+            #Goal to all other vertices
+            self._update_goal_edges()
+
+    def link_vertices(self, first: int) -> None:
+        #Static rows from first on, each vertex against the ones before it.
+        #Dense rows are computed in blocks of about PAIRS_PER_CHUNK entries and
+        #only the edges (i > j, length > 0) are kept.
+        n = self.n_vertices
+        rows = [self.static_graph.row]
+        cols = [self.static_graph.col]
+        weights = [self.static_graph.data]
+        step = max(1, PAIRS_PER_CHUNK//max(n, 1))
+        for a in range(first, n, step):
+            b = min(a + step, n)
+            block = kernels.backend.vertex_rows(
+                np.asarray(self.scene_data.coords),
+                self.prev,
+                self.nxt,
+                self.polygon_ids,
+                self.vertex_ids,
+                self.edge_array,
+                a,
+                b,
+                self.reduced
+            )
+            i, j = np.nonzero(block > 0)
+            rows.append(i + a)
+            cols.append(j)
+            weights.append(block[i, j])
+        self.static_graph = coo_array(
+            (np.concatenate(weights), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(n, n)
+        )
 
-        #Goal to all other vertices
-        self._update_goal_edges()
+    def extend_graph(self, polygon: Polygon) -> int:
+        #Old edges are only tested against the new polygon and only the new
+        #vertices get rows of their own. Returns the first new row.
+        if signed_area(polygon.array()) > 0:
+            polygon = Polygon(polygon.points[::-1])
+        n_old = self.n_vertices
+        old_graph = self.static_graph
+        data = self.scene_data.append(polygon)
+        if getattr(self.scene, "scene_data", None) is not None:
+            self.scene.scene_data = data
+        else:
+            self.scene.polygons = list(self.scene.polygons) + [polygon]
+        self.load_arrays(data)
+
+        rows, cols = old_graph.row, old_graph.col
+        segments = np.hstack([self.vertex_array[rows], self.vertex_array[cols]])
+        new_edges = self.edge_array[-polygon.len:]
+        free = kernels.backend.segments_free(segments, new_edges)
+        self.static_graph = coo_array(
+            (old_graph.data[free], (rows[free], cols[free])),
+            shape=(self.n_vertices, self.n_vertices)
+        )
+        self.link_vertices(n_old)
+        self.goal_edges = np.full(self.n_vertices + 1, -1.0)
+        return n_old
+
+    def add_polygon(self, polygon: Polygon) -> None:
+        with profiler.stage("add_polygon"):
+            self.extend_graph(polygon)
+            self.link_endpoints()
+        self.shortest_path = self.get_shortest_path()
 
     def get_shortest_path(self, start: Point = None, goal: Point = None) -> list:
         if start is None:
@@ -187,18 +243,42 @@ class VisibilityGraphPlanner:
         if goal is None:
             goal = self._goal
 
-        graph = csr_array(self.graph.T)
-        graph[graph < 0] = np.inf
-
-        j = self.n_vertices + 1
         i = self.n_vertices
-
-        dist_matrix, predecessors = dijkstra(
-            csgraph=graph,
-            directed=False,
-            indices = i,
-            return_predecessors=True
-        )
+        j = self.n_vertices + 1
+        with profiler.stage("csr"):
+            #Static edges plus the start (row i) and goal (row j) ones
+            start_js = np.flatnonzero(self.start_edges > 0)
+            goal_js = np.flatnonzero(self.goal_edges > 0)
+            graph = csr_array(
+                (
+                    np.concatenate([
+                        self.static_graph.data,
+                        self.start_edges[start_js],
+                        self.goal_edges[goal_js]
+                    ]),
+                    (
+                        np.concatenate([
+                            self.static_graph.row,
+                            np.full(len(start_js), i),
+                            np.full(len(goal_js), j)
+                        ]),
+                        np.concatenate([self.static_graph.col, start_js, goal_js])
+                    )
+                ),
+                shape=(j + 1, j + 1)
+            )
+        if profiler.enabled:
+            profiler.count("edges_kept", graph.nnz)
+
+        with profiler.stage("dijkstra"):
+            dist_matrix, predecessors = dijkstra(
+                csgraph=graph,
+                directed=False,
+                indices = i,
+                return_predecessors=True
+            )
+        if profiler.enabled:
+            profiler.count("dijkstra_nodes", int(np.isfinite(dist_matrix).sum()))
         #print(dist_matrix[self.n_vertices + 1])
         path = []
 
@@ -210,17 +290,50 @@ class VisibilityGraphPlanner:
                 raise ValueError("No path exists.")
         path.append(current)
 
-        all_vertices = self.vertices + [self._start, self._goal]
-        vertices_path = [all_vertices[vertex_i] for vertex_i in path]
+        #Points are only created for the vertices on the path
+        vertices_path = [self._goal] + [
+            Point(*self.vertex_array[vertex_i].tolist())
+            for vertex_i in path[1:-1]
+        ] + [self._start]
 
         return Path(vertices_path)
 
+    def link_endpoints(self) -> None:
+        self._update_goal_edges()
+        self._update_start_edges()
+
+    def plan(self, start: Point, goal: Point) -> Path:
+        #Moves both endpoints and searches once. Without a path the previous
+        #endpoints and their edges are put back before raising.
+        previous = (self._start, self._goal, self.start_edges, self.goal_edges)
+        self._start = start
+        self._goal = goal
+        try:
+            self.link_endpoints()
+            self.shortest_path = self.get_shortest_path()
+        except ValueError:
+            self._start, self._goal, self.start_edges, self.goal_edges = previous
+            raise
+        return self.shortest_path
+
     def reached_goal(self, th: float = 0.0005) -> bool:
         dx = self._goal.x - self._start.x
         dy = self._goal.y - self._start.y
         return dx**2 + dy**2 < th
 
+    @property
+    def result(self) -> PlanResult:
+        return PlanResult(
+            self._start,
+            self._goal,
+            self.start_edges.copy(),
+            self.goal_edges.copy(),
+            self.shortest_path
+        )
+
 class ReducedVisibilityGraphPlanner(VisibilityGraphPlanner):
+    reduced = True
+
     def __init__(
             self,
             scene: GLScene,
@@ -230,86 +343,47 @@ class ReducedVisibilityGraphPlanner(VisibilityGraphPlanner):
             **kwargs
         ) -> None:
         super().__init__(scene, start, goal, *args, **kwargs)
-        self.filter_static_edges()
         self.filter_start_edges()
         self.filter_goal_edges()
 
-    def get_vertices(self) -> list:
-        #return super().get_vertices()
-        vertices = []
-        for polygon in self.scene.polygons:
-            for i, vertex in enumerate(polygon.points):
-                prev_vertex = polygon.points[(i - 1) % polygon.len]
-                next_vertex = polygon.points[(i + 1) % polygon.len]
-                cross = np.cross(
-                    [vertex.x - prev_vertex.x, vertex.y - prev_vertex.y],
-                    [next_vertex.x - vertex.x, next_vertex.y - vertex.y]
-                )
-                if cross > 0:
-                    continue
-                vertices.append(vertex)
-        return vertices
-
-    def filter_static_edges(self) -> None:
-        for i in range(1, self.n_vertices):
-            start = self.vertices[i]
-            for j in range(i):
-                goal = self.vertices[j]
-                if self.graph[i][j] == -1:
-                    continue
-                if self.same_obstacle(start, goal):
-                    continue
-                if self.is_bitangent(start, goal):
-                    continue
-                self.graph[i][j] = -1
+    def get_vertex_mask(self) -> np.ndarray:
+        #Concave vertices are never part of a shortest path
+        crosses = polygon_vertex_crosses(
+            np.asarray(self.scene_data.coords),
+            self.scene_data.offsets
+        )
+        return ~(crosses > 0)
 
     def filter_start_edges(self) -> None:
-        start_idx = self.n_vertices
-        for j, vertex in enumerate(self.vertices):
-            if self.graph[start_idx][j] == -1:
-                continue
-            if self.is_tangent(self._start, vertex):
-                self.graph[start_idx][j] = Segment(self._start, vertex).len()
-            else:
-                self.graph[start_idx][j] = -1
+        with profiler.stage("reduced_filters"):
+            self.filter_point_edges(self.start_edges, self._start)
 
     def filter_goal_edges(self) -> None:
-        goal_idx = self.n_vertices + 1
-        for j, vertex in enumerate(self.vertices):
-            if self.graph[goal_idx][j] == -1:
-                continue
-            if self.is_tangent(self._goal, vertex):
-                self.graph[goal_idx][j] = Segment(self._goal, vertex).len()
-            else:
-                self.graph[goal_idx][j] = -1
-
-    def same_obstacle(self, start: Point, goal: Point) -> bool:
-        start_polygon = self.get_vertex_polygon(start)
-        goal_polygon = self.get_vertex_polygon(goal)
-        return start_polygon == goal_polygon
-
-    def is_bitangent(self, edga_a: Point, edga_b: Point) -> bool:
-        return (
-            self.is_tangent(edga_a, edga_b) and
-            self.is_tangent(edga_b, edga_a)
+        with profiler.stage("reduced_filters"):
+            self.filter_point_edges(self.goal_edges[:self.n_vertices], self._goal)
+
+    def filter_point_edges(self, row: np.ndarray, point: Point) -> None:
+        #Drops, in place, the edges from point to vertices it is not tangent to
+        js = np.flatnonzero(row != -1)
+        points = np.broadcast_to([point.x, point.y], (len(js), 2))
+        tangent = self.tangent_mask(points, self.vertex_ids[js])
+        row[js[~tangent]] = -1
+
+    def tangent_mask(self, points: np.ndarray, goals: np.ndarray) -> np.ndarray:
+        #Whether each point sees both neighbours of the scene vertex goals
+        #on the same side, as a mask
+        return kernels.backend.tangent_mask(
+            points,
+            goals,
+            np.asarray(self.scene_data.coords),
+            self.prev,
+            self.nxt
         )
 
-    def is_tangent(self, start: Point, goal: Point) -> bool:
-        polygon = self.get_vertex_polygon(goal)
-        if polygon is None:
-            raise RuntimeError("Goal edge must be a polygon edge")
-        goal_edge_idx = polygon.points.index(goal)
-        prev_goal_edge = polygon.points[(goal_edge_idx + 1) % polygon.len]
-        next_goal_edge = polygon.points[(goal_edge_idx - 1) % polygon.len]
-        start_goal_disp = Segment(start, goal).displacement
-        goal_prev_disp = Segment(goal, prev_goal_edge).displacement
-        goal_next_disp = Segment(goal, next_goal_edge).displacement
-        
-        #Cross product check
-        prev_cross = np.cross(start_goal_disp, goal_prev_disp)
-        next_cross = np.cross(start_goal_disp, goal_next_disp)
-        same_orientation = prev_cross * next_cross > 0
-        return same_orientation
+    def link_endpoints(self) -> None:
+        super().link_endpoints()
+        self.filter_start_edges()
+        self.filter_goal_edges()
 
     @VisibilityGraphPlanner.start.setter
     def start(self, point: Point) -> None:
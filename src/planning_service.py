@@ -0,0 +1,238 @@
+import asyncio
+import copy
+import time
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from scene.scenes import Point
+from scene.server import HttpServer
+from planner import VisibilityGraphPlanner, ReducedVisibilityGraphPlanner
+from scene_file import headless_scene
+
+
+class PlanningService:
+    #Keeps one built planner per worker. Queries from concurrent requests are
+    #queued and every worker drains up to max_batch of them at a time, waiting
+    #at most max_wait seconds for the batch to fill.
+    def __init__(
+            self,
+            planner: VisibilityGraphPlanner,
+            workers: int = 4,
+            max_batch: int = 64,
+            max_wait: float = 0.002,
+            window: int = 10000
+        ) -> None:
+        self.planners = [planner] + [
+            copy.deepcopy(planner) for _ in range(workers - 1)
+        ]
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.queue = None
+        self.tasks = []
+
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.queries = 0
+        self.batches = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=window)
+
+    async def start(self) -> None:
+        self.queue = asyncio.Queue()
+        self.tasks = [
+            asyncio.create_task(self.worker(planner))
+            for planner in self.planners
+        ]
+
+    async def submit(self, queries: list) -> list:
+        tic = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for query in queries:
+            start = Point(*map(float, query["start"]))
+            goal = Point(*map(float, query["goal"]))
+            future = loop.create_future()
+            self.queue.put_nowait((start, goal, future))
+            futures.append(future)
+        paths = await asyncio.gather(*futures)
+        self.requests += 1
+        self.queries += len(queries)
+        self.latencies.append(time.perf_counter() - tic)
+        return paths
+
+    async def worker(self, planner: VisibilityGraphPlanner) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(
+                        await asyncio.wait_for(self.queue.get(), timeout)
+                    )
+                except asyncio.TimeoutError:
+                    break
+            paths = await loop.run_in_executor(
+                self.executor,
+                self.solve,
+                planner,
+                [(start, goal) for start, goal, _ in batch]
+            )
+            self.batches += 1
+            self.failed += sum(path is None for path in paths)
+            for (_, _, future), path in zip(batch, paths):
+                if not future.done():
+                    future.set_result(path)
+
+    def solve(self, planner: VisibilityGraphPlanner, queries: list) -> list:
+        #Runs on the pool, the planner is only used by this worker
+        paths = []
+        for start, goal in queries:
+            try:
+                path = planner.plan(start, goal)
+            except ValueError:
+                paths.append(None)
+                continue
+            #Planner paths go from goal to start
+            paths.append([[point.x, point.y] for point in path.points[::-1]])
+        return paths
+
+    def metrics(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        latencies = np.array(self.latencies)*1000
+        if len(latencies):
+            p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        else:
+            p50 = p90 = p99 = 0.0
+        return {
+            "workers": len(self.planners),
+            "requests": self.requests,
+            "queries": self.queries,
+            "without_path": self.failed,
+            "batches": self.batches,
+            "mean_batch": self.queries/self.batches if self.batches else 0.0,
+            "requests_per_s": self.requests/elapsed,
+            "queries_per_s": self.queries/elapsed,
+            "latency_ms": {"p50": p50, "p90": p90, "p99": p99}
+        }
+
+
+def build_server(service: PlanningService, host: str, port: int) -> HttpServer:
+    server = HttpServer(host, port)
+
+    @server.route("POST", "/paths")
+    async def paths(data: dict) -> tuple:
+        return 200, {"paths": await service.submit(data["queries"])}
+
+    @server.route("POST", "/path")
+    async def path(data: dict) -> tuple:
+        paths = await service.submit([data])
+        return 200, {"path": paths[0]}
+
+    @server.route("GET", "/metrics")
+    async def metrics(data: dict) -> tuple:
+        return 200, service.metrics()
+
+    @server.route("GET", "/health")
+    async def health(data: dict) -> tuple:
+        return 200, {
+            "status": "ok",
+            "vertices": service.planners[0].n_vertices
+        }
+
+    return server
+
+
+def parse_args() -> object:
+    parser = ArgumentParser()
+
+    parser.add_argument(
+        "--complete",
+        action = "store_true",
+        help = "Usa el grafo de visibilidad completo"
+    )
+    parser.add_argument(
+        "--scene",
+        default = None,
+        type = str,
+        help = "Escena binaria, .wkt o .geojson"
+    )
+    parser.add_argument(
+        "--map",
+        default = None,
+        type = str,
+        help = "Imagen o rejilla .npy de ocupación"
+    )
+    parser.add_argument(
+        "--host",
+        default = "127.0.0.1",
+        type = str,
+        help = "Dirección del servicio"
+    )
+    parser.add_argument(
+        "--port",
+        default = 8000,
+        type = int,
+        help = "Puerto del servicio"
+    )
+    parser.add_argument(
+        "--workers",
+        default = 4,
+        type = int,
+        help = "Planificadores atendiendo consultas en paralelo"
+    )
+    parser.add_argument(
+        "--max-batch",
+        default = 64,
+        type = int,
+        help = "Consultas máximas por lote"
+    )
+    parser.add_argument(
+        "--max-wait",
+        default = 2.0,
+        type = float,
+        help = "Espera máxima en ms para llenar un lote"
+    )
+
+    args = parser.parse_args()
+    return args
+
+async def serve(args: object) -> None:
+    if args.complete:
+        planner_cls = VisibilityGraphPlanner
+    else:
+        planner_cls = ReducedVisibilityGraphPlanner
+
+    tic = time.perf_counter()
+    planner = planner_cls(
+        headless_scene(args),
+        Point(-0.9, 0.9),
+        Point(0.9, 0.9)
+    )
+    service = PlanningService(
+        planner,
+        workers = args.workers,
+        max_batch = args.max_batch,
+        max_wait = args.max_wait/1000
+    )
+    print(f"{planner.n_vertices} vertices, {args.workers} workers, "
+          f"build {1000*(time.perf_counter() - tic):.2f} ms")
+
+    await service.start()
+    server = build_server(service, args.host, args.port)
+    print(f"Listening on http://{args.host}:{args.port}")
+    await server.serve_forever()
+
+def main() -> None:
+    asyncio.run(serve(parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+from threading import Thread, Condition, Lock
+
+import numpy as np
+from scipy.sparse import coo_array
+
+from scene.scenes import Point
+from planner import VisibilityGraphPlanner, PlanResult
+from shapes import Path, Polygon
+
+
+class PlanningWorker:
+    #Owns the planner and replans on its own thread. Exposes the same
+    #start/goal/shortest_path surface as the planner so the scene and the
+    #driver can use it directly; setters only queue a request.
+    def __init__(self, planner: VisibilityGraphPlanner) -> None:
+        self.planner = planner
+        self._thread = Thread(target=self.run, daemon=True)
+        self._pending = {}
+        self._condition = Condition()
+        self._swap_lock = Lock()
+        self._front = planner.result
+        self._back = None
+        self._static = (planner.vertex_array, planner.static_graph)
+        self._start = planner.start
+        self._goal = planner.goal
+        self._running = True
+        self.error = None
+        #Published path that a new polygon cut, until the next plan
+        self.stale = None
+        self.plans = 0
+        self.coalesced = 0
+
+    @property
+    def n_vertices(self) -> int:
+        return len(self.vertex_array)
+
+    @property
+    def vertex_array(self) -> np.ndarray:
+        with self._swap_lock:
+            return self._static[0]
+
+    @property
+    def static_graph(self) -> coo_array:
+        #Only changes when a polygon is added and is published together with
+        #the vertices
+        with self._swap_lock:
+            return self._static[1]
+
+    @property
+    def result(self) -> PlanResult:
+        with self._swap_lock:
+            return self._front
+
+    @property
+    def shortest_path(self) -> Path:
+        return self.result.shortest_path
+
+    @property
+    def start(self) -> Point:
+        return self._start
+
+    @start.setter
+    def start(self, point: Point) -> None:
+        self.request(start=point)
+
+    @property
+    def goal(self) -> Point:
+        return self._goal
+
+    @goal.setter
+    def goal(self, point: Point) -> None:
+        self.request(goal=point)
+
+    def plan(self, start: Point, goal: Point) -> Path:
+        #Queues both endpoints as one request, returns the last published path
+        self.request(start=start, goal=goal)
+        return self.shortest_path
+
+    def reached_goal(self, th: float = 0.0005) -> bool:
+        dx = self._goal.x - self._start.x
+        dy = self._goal.y - self._start.y
+        return dx**2 + dy**2 < th
+
+    def request(self, start: Point = None, goal: Point = None) -> None:
+        with self._condition:
+            for key, point in (("start", start), ("goal", goal)):
+                if point is None:
+                    continue
+                if key in self._pending:
+                    self.coalesced += 1
+                self._pending[key] = point
+                setattr(self, f"_{key}", point)
+            self._condition.notify()
+
+    def add_polygon(self, polygon: Polygon) -> None:
+        with self._condition:
+            self._pending.setdefault("polygons", []).append(polygon)
+            self._condition.notify()
+
+    def launch(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join()
+
+    def run(self) -> None:
+        while True:
+            with self._condition:
+                while self._running and not self._pending:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                pending, self._pending = self._pending, {}
+
+            #New polygons first, then both endpoints and a single search
+            try:
+                for polygon in pending.get("polygons", []):
+                    self.planner.extend_graph(polygon)
+                self.planner.plan(
+                    pending.get("start", self.planner.start),
+                    pending.get("goal", self.planner.goal)
+                )
+            except ValueError as error:
+                self.error = error
+                self.restore()
+                continue
+            self.error = None
+            self.publish(self.planner.result)
+            self.plans += 1
+
+    def restore(self) -> None:
+        #Back to the last published plan, so the endpoints, the planner and
+        #the result agree again. Endpoints queued meanwhile are kept.
+        front = self.result
+        with self._condition:
+            if "start" not in self._pending:
+                self._start = front.start
+            if "goal" not in self._pending:
+                self._goal = front.goal
+        try:
+            self.planner.plan(front.start, front.goal)
+        except ValueError:
+            #A new polygon cut that plan too: only the graph is published
+            self.stale = front.shortest_path
+            self.publish(front)
+            return
+        self.publish(self.planner.result)
+
+    def publish(self, result: PlanResult) -> None:
+        self._back = result
+        with self._swap_lock:
+            self._front, self._back = self._back, self._front
+            self._static = (self.planner.vertex_array, self.planner.static_graph)
@@ -1,17 +1,16 @@
 import numpy as np
 import pygame
 
-from scene.scenes import Point, GLUtils, GLScene
+from scene.scenes import Point, GLUtils, GLScene, Loop
 from shapes import Polygon, Segment
 from planner import VisibilityGraphPlanner, ReducedVisibilityGraphPlanner
 from driver import ConstantVelocityParticle
-
-
-default_polygons = [
-    Polygon([[-0.8, 0.2], [-0.6, 0.6], [-0.5, 0.4], [-0.15, 0.27]]),
-    Polygon([[-0.5, -0.6], [-0.8, -0.6], [-0.2, -0.4], [-0.46, -0.92]]),
-    Polygon([[0.33, -0.12], [0, -0.2], [0.2, 0.2], [0.4, 0.04], [0.8, 0.2], [0.62, -0.27]])
-]
+from planning_worker import PlanningWorker
+from fleet import Fleet, free_points
+from scene_file import SceneData, default_polygons
+from preprocessing import ObstaclePreprocessor
+from scene.profiler import profiler
+from scene.telemetry import EVENT_REPLAN, EVENT_ARRIVED
 
 
 class PolygonScene(GLScene):
@@ -25,13 +24,43 @@ class PolygonScene(GLScene):
             **kwargs
         ) -> None:
         super().__init__(title, width, height, max_fps)
-        self.polygons = kwargs.get("polygons", default_polygons)
+        #The arrays are the scene, Polygon objects are only built on demand
+        self.scene_data = kwargs.get("scene_data", None)
+        if self.scene_data is None:
+            self.scene_data = SceneData.from_polygons(
+                kwargs.get("polygons", default_polygons)
+            )
+        if kwargs.get("preprocess", False):
+            preprocessor = ObstaclePreprocessor(
+                tolerance = kwargs.get("tolerance", 0.01),
+                merge = kwargs.get("merge", True)
+            )
+            self.scene_data = SceneData.from_polygons(
+                preprocessor.run(self.scene_data.polygons)
+            )
         self.shortest_path = None
 
+    @property
+    def polygons(self) -> list:
+        return self.scene_data.polygons
+
+    def build_planner(
+            self,
+            start: Point,
+            goal: Point,
+            *args,
+            **kwargs
+        ) -> VisibilityGraphPlanner:
+        complete = kwargs.get("complete", False)
+        if complete:
+            planner_cls = VisibilityGraphPlanner
+        else:
+            planner_cls = ReducedVisibilityGraphPlanner
+        return planner_cls(self, start, goal, *args, **kwargs)
+
     def render(self) -> None:
         super().render()
-        for polygon in self.polygons:
-            polygon.draw()
+        GLUtils.draw_polygon_array(self.scene_data.coords, self.scene_data.offsets)
 
 
 class VisibilityGraphScene(PolygonScene):
@@ -45,87 +74,236 @@ class VisibilityGraphScene(PolygonScene):
             **kwargs
         ) -> None:
         super().__init__(title, width, height, max_fps, *args, **kwargs)
-        complete = kwargs.get("complete", False)
-        if complete:
-            self.planner = VisibilityGraphPlanner(
-                self,
-                Point(-0.9, 0.9),
-                Point(0.9, 0.9),
-                *args,
-                **kwargs
-            )
-        else:
-            self.planner = ReducedVisibilityGraphPlanner(
-                self,
-                Point(-0.9, 0.9),
-                Point(0.9, 0.9),
-                *args,
-                **kwargs
-            )
+        self.planner = self.build_planner(
+            Point(-0.9, 0.9),
+            Point(0.9, 0.9),
+            *args,
+            **kwargs
+        )
+        if kwargs.get("threaded", False):
+            self.planner = PlanningWorker(self.planner)
+            self.planner.launch()
+        self.result = self.planner.result
         self.driver = ConstantVelocityParticle(self.planner)
         self.pause = True
+        self.arrived = False
+        self.replans = 0
+        self.drawing = False
+        self.stroke = None
+        self.stroke_tolerance = kwargs.get("stroke_tolerance", 0.02)
 
     def draw_visibility_graph(self):
-        for i in range(1, self.planner.n_vertices):
-            start = self.planner.vertices[i]
-            for j in range(i):
-                goal = self.planner.vertices[j]
-                if self.planner.graph[i][j] == -1:
-                    continue
-                Segment(start, goal).draw()
-
-        GLUtils.draw_points([self.planner.start, self.planner.goal])
-
-        start_idx = self.planner.n_vertices
-        for j, vertex in enumerate(self.planner.vertices):
-            if self.planner.graph[start_idx][j] == -1:
-                continue
-            Segment(self.planner.start, vertex).draw()
+        #Vertices and graph may grow while drawing when planning is threaded,
+        #the result can be one polygon behind or ahead of them
+        graph = self.planner.static_graph
+        vertices = self.planner.vertex_array
+        GLUtils.draw_segment_array(
+            np.hstack([vertices[graph.row], vertices[graph.col]])
+        )
 
-        goal_idx = start_idx + 1
-        for j, vertex in enumerate(self.planner.vertices):
-            if self.planner.graph[goal_idx][j] == -1:
-                continue
-            Segment(self.planner.goal, vertex).draw()
+        result = self.result
+        GLUtils.draw_points([result.start, result.goal])
 
-        if self.planner.graph[goal_idx][start_idx] != -1:
-            Segment(self.planner.goal, self.planner.start).draw()
+        for point, edges in (
+                (result.start, result.start_edges),
+                (result.goal, result.goal_edges)
+            ):
+            js = np.flatnonzero(edges[:len(vertices)] != -1)
+            segments = np.empty((len(js), 4))
+            segments[:, :2] = [point.x, point.y]
+            segments[:, 2:] = vertices[js]
+            GLUtils.draw_segment_array(segments)
+
+        if result.start_goal_edge != -1:
+            Segment(result.goal, result.start).draw()
 
     def get_inputs(self) -> None:
         super().get_inputs()
         for event in self.events:
+            if self.drawing and self.draw_obstacle(event):
+                continue
             if event.type == pygame.MOUSEBUTTONDOWN:
                 x, y = pygame.mouse.get_pos()
                 screen_point = Point(x, y)
                 ortho = self.to_ortho(screen_point)
                 ortho.y *= -1
-                if event.button == 1: #Left click
-                    self.planner.start = ortho
-                if event.button == 3: #Right click
-                    self.planner.goal = ortho
+                try:
+                    if event.button == 1: #Left click
+                        self.driver.position = ortho
+                    if event.button == 3: #Right click
+                        self.driver.replan(goal = ortho)
+                except ValueError:
+                    #Clicked inside an obstacle or a closed pocket
+                    print(f"No path to ({ortho.x:.3f}, {ortho.y:.3f}), ignored")
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_p:
                     self.pause = not self.pause
+                if event.key == pygame.K_d:
+                    self.drawing = not self.drawing
+                    self.stroke = None
+
+    def draw_obstacle(self, event: pygame.event.Event) -> bool:
+        #Left button strokes become obstacles once they close on themselves
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            self.stroke = Loop(self.stroke_tolerance)
+            return True
+        if event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+            self.stroke = None
+            return True
+        if event.type == pygame.MOUSEMOTION and self.stroke is not None:
+            x, y = pygame.mouse.get_pos()
+            ortho = self.to_ortho(Point(x, y))
+            ortho.y *= -1
+            self.stroke.append(ortho)
+            if self.stroke.is_loop():
+                self.add_obstacle(Polygon(self.stroke.points))
+                self.stroke = None
+            return True
+        return False
+
+    def add_obstacle(self, polygon: Polygon) -> None:
+        #The planner appends it to self.scene_data and updates its graph
+        try:
+            self.planner.add_polygon(polygon)
+            self.driver.replan()
+        except ValueError:
+            #The obstacle cut every path, the old one would go through it
+            print("No path after adding the obstacle, the particle stops")
+            self.driver.stop()
 
     def update(self) -> None:
         super().update()
-        self.shortest_path = self.planner.shortest_path
+        if self.driver.trajectory.path is getattr(self.planner, "stale", None):
+            #Same for obstacles added on the planning thread
+            self.driver.stop()
         if not self.pause:
             self.driver.update(self.delta_time)
+        self.result = self.planner.result
+        self.shortest_path = self.driver.remaining_path()
+
+    def publish_telemetry(self, timings: tuple) -> None:
+        arrived = self.driver.reached_goal()
+        if arrived and not self.arrived:
+            self.telemetry.event(EVENT_ARRIVED)
+        self.arrived = arrived
+        if self.driver.replans != self.replans:
+            self.telemetry.event(EVENT_REPLAN)
+            self.replans = self.driver.replans
+        position = self.driver.position
+        path = np.array([
+            [point.x, point.y] for point in self.shortest_path.points[::-1]
+        ])
+        self.telemetry.publish(
+            self.delta_time,
+            timings,
+            position = (position.x, position.y),
+            path = path,
+            replans = self.driver.replans
+        )
 
     def render(self) -> None:
         super().render()
-        self.draw_visibility_graph()
-        self.shortest_path.draw()
+        if self.stroke is not None and len(self.stroke.points) > 1:
+            GLUtils.draw_polygon(self.stroke.points, True)
+        with profiler.stage("draw_graph"):
+            self.draw_visibility_graph()
+            self.shortest_path.draw()
+        position = self.driver.position
         GLUtils.draw_point(
-            self.planner.start.x,
-            self.planner.start.y,
+            position.x,
+            position.y,
             5,
             color = (1, 1, 1, 1)
         )
         GLUtils.draw_point(
-            self.planner.goal.x,
-            self.planner.goal.y,
+            self.result.goal.x,
+            self.result.goal.y,
             10,
             color = (1, 1, 1, 1)
         )
+
+
+class FleetScene(PolygonScene):
+    def __init__(
+            self,
+            title: str,
+            width: int,
+            height: int,
+            max_fps: int,
+            *args,
+            **kwargs
+        ) -> None:
+        super().__init__(title, width, height, max_fps, *args, **kwargs)
+        goal = Point(0.9, 0.9)
+        self.planner = self.build_planner(
+            Point(-0.9, 0.9),
+            goal,
+            *args,
+            **kwargs
+        )
+        self.rng = np.random.default_rng(kwargs.get("seed", None))
+        self.n_agents = kwargs.get("agents", 100)
+        self.fleet = Fleet(
+            self.planner,
+            free_points(self.scene_data, self.n_agents, self.rng),
+            [goal.x, goal.y]
+        )
+        self.pause = True
+        self.replans = 0
+
+    def get_inputs(self) -> None:
+        super().get_inputs()
+        for event in self.events:
+            if event.type == pygame.MOUSEBUTTONDOWN:
+                x, y = pygame.mouse.get_pos()
+                screen_point = Point(x, y)
+                ortho = self.to_ortho(screen_point)
+                ortho.y *= -1
+                if event.button == 1: #Left click
+                    self.fleet.positions = free_points(
+                        self.scene_data,
+                        self.n_agents,
+                        self.rng
+                    )
+                    self.fleet.relink()
+                    self.replans += 1
+                if event.button == 3: #Right click
+                    self.fleet.set_goals([ortho.x, ortho.y])
+                    self.replans += 1
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_p:
+                    self.pause = not self.pause
+
+    def update(self) -> None:
+        super().update()
+        if self.driver.trajectory.path is getattr(self.planner, "stale", None):
+            #Same for obstacles added on the planning thread
+            self.driver.stop()
+        if not self.pause:
+            self.fleet.update(self.delta_time)
+
+    def publish_telemetry(self, timings: tuple) -> None:
+        #First agent and the next waypoint it is heading to
+        position = self.fleet.positions[0]
+        path = np.array([position, self.fleet.target_points()[0]])
+        self.telemetry.publish(
+            self.delta_time,
+            timings,
+            position = tuple(position),
+            path = path,
+            replans = self.replans
+        )
+
+    def render(self) -> None:
+        super().render()
+        with profiler.stage("draw_fleet"):
+            GLUtils.draw_point_array(
+                self.fleet.positions,
+                size = 4,
+                color = (1, 1, 1, 1)
+            )
+            GLUtils.draw_point_array(
+                self.fleet.unique_goals,
+                size = 10,
+                color = (1, 1, 1, 1)
+            )
@@ -0,0 +1,87 @@
+import numpy as np
+
+from shapes import Polygon
+from geometry import (
+    clockwise,
+    simplify_outward,
+    prune_vertices,
+    polygon_union,
+    points_in_polygon,
+    segment_crossings
+)
+
+
+class ObstaclePreprocessor:
+    def __init__(
+            self,
+            tolerance: float = 0.01,
+            merge: bool = True,
+            area_tolerance: float = None
+        ) -> None:
+        self.tolerance = tolerance
+        self.merge_overlapping = merge
+        if area_tolerance is None:
+            area_tolerance = tolerance**2
+        self.area_tolerance = area_tolerance
+
+    def run(self, polygons: list) -> list:
+        coords = [clockwise(polygon.array()) for polygon in polygons]
+        coords = self.simplify(coords)
+        if self.merge_overlapping:
+            coords = self.merge(coords)
+        coords = self.prune(coords)
+        return [Polygon(polygon.tolist()) for polygon in coords]
+
+    def simplify(self, coords: list) -> list:
+        return [simplify_outward(polygon, self.tolerance) for polygon in coords]
+
+    def merge(self, coords: list) -> list:
+        merged = []
+        for cluster in self.overlapping_clusters(coords):
+            if len(cluster) == 1:
+                merged.append(coords[cluster[0]])
+                continue
+            members = [coords[i] for i in cluster]
+            union = polygon_union(members)
+            #Degenerate overlaps (shared edges) cannot be chained, keep as is
+            merged.extend(members if union is None else union)
+        return merged
+
+    def prune(self, coords: list) -> list:
+        #Only shallow concave vertices go. Filling a deeper pocket would take
+        #free space (maybe a start or goal) away. Such vertices still never
+        #lie on a shortest path: the reduced planner drops them from its graph.
+        return [prune_vertices(polygon, self.area_tolerance) for polygon in coords]
+
+    @staticmethod
+    def overlapping_clusters(coords: list) -> list:
+        n = len(coords)
+        parent = list(range(n))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        lows = np.array([polygon.min(axis=0) for polygon in coords])
+        highs = np.array([polygon.max(axis=0) for polygon in coords])
+        for a in range(n):
+            for b in range(a + 1, n):
+                if np.any(lows[a] > highs[b]) or np.any(lows[b] > highs[a]):
+                    continue
+                edges_a = np.hstack([coords[a], np.roll(coords[a], -1, axis=0)])
+                edges_b = np.hstack([coords[b], np.roll(coords[b], -1, axis=0)])
+                overlap = (
+                    np.any(segment_crossings(edges_a, edges_b)[0]) or
+                    np.any(points_in_polygon(coords[a][:1], coords[b])) or
+                    np.any(points_in_polygon(coords[b][:1], coords[a]))
+                )
+                if overlap:
+                    parent[find(a)] = find(b)
+
+        clusters = {}
+        for i in range(n):
+            clusters.setdefault(find(i), []).append(i)
+        return list(clusters.values())
+
@@ -0,0 +1,124 @@
+import numpy as np
+from scipy import ndimage
+
+from shapes import Polygon
+from geometry import signed_area, simplify_outward, prune_vertices
+
+#Pixel boundary directions in image coordinates (row grows downwards)
+DIRECTIONS = np.array([[1, 0], [0, 1], [-1, 0], [0, -1]])
+
+
+def load_grid(path: str, threshold: int = 128) -> np.ndarray:
+    #Occupancy grid: True where the map is an obstacle (dark pixels)
+    if path.endswith(".npy"):
+        grid = np.load(path)
+        if grid.dtype != bool:
+            grid = grid < threshold
+        return grid
+    from PIL import Image
+    image = np.asarray(Image.open(path).convert("L"))
+    return image < threshold
+
+def clean_grid(grid: np.ndarray, min_pixels: int = 4) -> np.ndarray:
+    #Holes cannot be represented by the planner, obstacles are filled
+    grid = ndimage.binary_fill_holes(grid)
+    labels, n_labels = ndimage.label(grid)
+    sizes = np.bincount(labels.ravel(), minlength=n_labels + 1)
+    small = sizes < min_pixels
+    small[0] = True
+    return ~small[labels]
+
+def boundary_edges(grid: np.ndarray) -> tuple:
+    #Unit edges between obstacle and free pixels, oriented clockwise on
+    #screen so the obstacle is always on the right hand side.
+    padded = np.pad(grid, 1)
+    inner = padded[1:-1, 1:-1]
+    rows, cols = [], []
+    dirs = []
+    free = [
+        ~padded[:-2, 1:-1], #above
+        ~padded[1:-1, 2:],  #right
+        ~padded[2:, 1:-1],  #below
+        ~padded[1:-1, :-2]  #left
+    ]
+    #Start corner (col, row) of each side for a pixel at (r, c)
+    starts = [(0, 0), (1, 0), (1, 1), (0, 1)]
+    for d, (open_side, (dc, dr)) in enumerate(zip(free, starts)):
+        r, c = np.nonzero(inner & open_side)
+        cols.append(c + dc)
+        rows.append(r + dr)
+        dirs.append(np.full(len(r), d))
+    return np.concatenate(cols), np.concatenate(rows), np.concatenate(dirs)
+
+def trace_contours(grid: np.ndarray) -> list:
+    cols, rows, dirs = boundary_edges(grid)
+    n_edges = len(dirs)
+    if n_edges == 0:
+        return []
+    width = grid.shape[1] + 1
+    keys = (rows*width + cols)*4 + dirs
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+
+    end_cols = cols + DIRECTIONS[dirs, 0]
+    end_rows = rows + DIRECTIONS[dirs, 1]
+    end_corner = end_rows*width + end_cols
+    #Prefer turning right at saddle corners, diagonal pixels stay apart
+    nxt = np.full(n_edges, -1)
+    for turn in (1, 0, 3):
+        pending = nxt < 0
+        wanted = end_corner[pending]*4 + (dirs[pending] + turn) % 4
+        pos = np.minimum(np.searchsorted(sorted_keys, wanted), n_edges - 1)
+        found = sorted_keys[pos] == wanted
+        idx = np.flatnonzero(pending)[found]
+        nxt[idx] = order[pos[found]]
+
+    #Pointer jumping: cycle id is the smallest edge index in the cycle
+    cycle = np.arange(n_edges)
+    jump = nxt.copy()
+    for _ in range(int(np.ceil(np.log2(n_edges))) + 1):
+        cycle = np.minimum(cycle, cycle[jump])
+        jump = jump[jump]
+
+    #List ranking: distance from each edge back to its cycle head
+    heads = cycle == np.arange(n_edges)
+    succ = np.where(heads[nxt], np.arange(n_edges), nxt)
+    dist = np.where(heads[nxt], 0, 1)
+    for _ in range(int(np.ceil(np.log2(n_edges))) + 1):
+        dist = dist + dist[succ]
+        succ = succ[succ]
+    order = np.lexsort((-dist, cycle))
+
+    #Keep only the corners where the boundary changes direction
+    cycle, dirs = cycle[order], dirs[order]
+    corners = np.stack([cols[order], rows[order]], axis=1)
+    first = np.r_[True, cycle[1:] != cycle[:-1]]
+    bounds = np.flatnonzero(np.r_[first, True])
+    prev_dirs = np.roll(dirs, 1)
+    last = np.r_[bounds[1:-1] - 1, len(dirs) - 1]
+    prev_dirs[bounds[:-1]] = dirs[last]
+    turning = dirs != prev_dirs
+    return [
+        corners[a:b][turning[a:b]]
+        for a, b in zip(bounds[:-1], bounds[1:])
+    ]
+
+def raster_polygons(
+        grid: np.ndarray,
+        tolerance: float = 1.5,
+        min_pixels: int = 4
+    ) -> list:
+    #Tolerance is given in pixels, polygons come out in ortho coordinates
+    height, width = grid.shape
+    polygons = []
+    for contour in trace_contours(clean_grid(grid, min_pixels)):
+        ortho = np.empty(contour.shape)
+        ortho[:, 0] = 2*contour[:, 0]/width - 1
+        ortho[:, 1] = 1 - 2*contour[:, 1]/height
+        if signed_area(ortho) >= 0:
+            continue
+        scale = 2/max(width, height)
+        ortho = simplify_outward(ortho, tolerance*scale)
+        ortho = prune_vertices(ortho, 0)
+        polygons.append(Polygon(ortho.tolist()))
+    return polygons
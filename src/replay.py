@@ -0,0 +1,106 @@
+from argparse import ArgumentParser
+
+import numpy as np
+
+from scene.telemetry import (
+    read_log,
+    EVENT_REPLAN,
+    EVENT_LOOP,
+    EVENT_STOP,
+    EVENT_ARRIVED
+)
+
+EVENTS = {
+    "replan": EVENT_REPLAN,
+    "loop": EVENT_LOOP,
+    "stop": EVENT_STOP,
+    "arrived": EVENT_ARRIVED
+}
+
+
+def parse_args() -> object:
+    parser = ArgumentParser()
+
+    parser.add_argument(
+        "log",
+        type = str,
+        help = "Registro binario de telemetría"
+    )
+    parser.add_argument(
+        "--csv",
+        default = None,
+        type = str,
+        help = "Exporta los cuadros sin rutas a CSV"
+    )
+    parser.add_argument(
+        "--frame",
+        default = None,
+        type = int,
+        help = "Muestra el estado completo de un cuadro"
+    )
+
+    args = parser.parse_args()
+    return args
+
+def summary(records: np.ndarray) -> None:
+    duration = records["time"][-1] - records["time"][0]
+    lost = int(records["dropped"][-1])
+    print(f"{len(records)} frames in {duration:.2f} s "
+          f"({len(records)/max(duration, 1e-9):.1f} fps), {lost} dropped")
+    for name in ("inputs_ms", "update_ms", "render_ms", "frame_ms"):
+        values = records[name]
+        p50, p99 = np.percentile(values, [50, 99])
+        print(f"  {name:10s} mean {values.mean():8.3f}  p50 {p50:8.3f}  "
+              f"p99 {p99:8.3f}  max {values.max():8.3f}")
+
+    replans = records["replans"].astype(np.int64)
+    print(f"  replans    {int(replans[-1] - replans[0])}")
+    for name, flag in EVENTS.items():
+        count = int(np.count_nonzero(records["events"] & flag))
+        if count:
+            print(f"  {name:10s} {count}")
+
+    positions = np.column_stack([records["x"], records["y"]])
+    positions = positions[~np.isnan(positions).any(axis=1)]
+    if len(positions) > 1:
+        travelled = np.hypot(*np.diff(positions, axis=0).T).sum()
+        print(f"  travelled  {travelled:.3f}")
+
+def show_frame(records: np.ndarray, frame: int) -> None:
+    matches = np.flatnonzero(records["frame"] == frame)
+    if not len(matches):
+        print(f"frame {frame} not in the log")
+        return
+    record = records[matches[0]]
+    for name in records.dtype.names:
+        if name == "path":
+            print(f"  path       {record['path'][:record['n_path']].tolist()}")
+        elif name != "n_path":
+            print(f"  {name:10s} {record[name]}")
+
+def main() -> None:
+    args = parse_args()
+    records = read_log(args.log)
+    if not len(records):
+        print("empty log")
+        return
+
+    summary(records)
+    if args.frame is not None:
+        show_frame(records, args.frame)
+    if args.csv is not None:
+        names = [
+            name for name in records.dtype.names
+            if name not in ("path", "n_path")
+        ]
+        np.savetxt(
+            args.csv,
+            np.column_stack([records[name].astype(float) for name in names]),
+            delimiter = ",",
+            header = ",".join(names),
+            comments = ""
+        )
+
+
+if __name__ == '__main__':
+    main()
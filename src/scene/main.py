@@ -1,77 +1,126 @@
-from flask import Flask, request, jsonify
-from threading import Thread
+import sys
+from threading import Lock
 
-from scenes import Scene, GLUtils, DrawingObstacles
-from models import Particle
+import numpy as np
 
-app = Flask(__name__)
-acceleration = {"ax": 0, "ay": 0}
-stop = False
+from scenes import Scene, GLUtils, DrawingObstacles, Loop
+from models import ParticleSystem
+from server import HttpServer
+from telemetry import Telemetry, EVENT_STOP
 
-@app.route("/set_acceleration", methods=["POST"])
-def set_acceleration():
-    global acceleration
-    try:
-        data = request.get_json()
-        ax = float(data.get("ax", 0.0))
-        ay = float(data.get("ay", 0.0))
-        acceleration["ax"] = ax
-        acceleration["ay"] = ay
-        return jsonify({
-            "message": "Acceleration updated",
-            "acceleration": acceleration
-        })
-    except Exception as e:
-        return jsonify({"error": str(e)}), 400
-
-@app.route("/stop", methods=["POST"])
-def stop():
-    global stop
-    global acceleration
-    try:
-        _ = request.get_json()
-        stop = True
-        acceleration["ax"] = 0
-        acceleration["ay"] = 0
-        return jsonify({"message": "Stopped"})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 400
+
+class Controls:
+    #Acceleration and stop requests written by the server thread and read
+    #once per frame by the scene
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self.ax = 0.0
+        self.ay = 0.0
+        self.stop = False
+
+    def set_acceleration(self, ax: float, ay: float) -> dict:
+        with self._lock:
+            self.ax = ax
+            self.ay = ay
+            return {"ax": self.ax, "ay": self.ay}
+
+    def request_stop(self) -> None:
+        with self._lock:
+            self.stop = True
+            self.ax = 0.0
+            self.ay = 0.0
+
+    def read(self) -> tuple:
+        #(ax, ay, stop), the stop request is consumed
+        with self._lock:
+            stop = self.stop
+            self.stop = False
+            return self.ax, self.ay, stop
+
+
+controls = Controls()
+server = HttpServer(host="0.0.0.0", port=5000)
+
+@server.route("POST", "/set_acceleration")
+async def set_acceleration(data: dict) -> tuple:
+    acceleration = controls.set_acceleration(
+        float(data.get("ax", 0.0)),
+        float(data.get("ay", 0.0))
+    )
+    return 200, {
+        "message": "Acceleration updated",
+        "acceleration": acceleration
+    }
+
+@server.route("POST", "/stop")
+async def stop(data: dict) -> tuple:
+    controls.request_stop()
+    return 200, {"message": "Stopped"}
 
 class ParticleScene(DrawingObstacles):
-    def __init__(self, title: str, width: int, height: int, max_fps: int) -> None:
+    def __init__(
+            self,
+            title: str,
+            width: int,
+            height: int,
+            max_fps: int,
+            n_particles: int = 2000
+        ) -> None:
         super().__init__(title, width, height, max_fps)
-        self.particle = Particle()
+        self.particles = ParticleSystem(n_particles)
+
+    def obstacle_edges(self) -> np.ndarray:
+        edges = []
+        for obstacle in self.obstacles:
+            if not obstacle.looped:
+                continue
+            points = np.array([[point.x, point.y] for point in obstacle.points])
+            edges.append(np.hstack([points, np.roll(points, -1, axis=0)]))
+        if not edges:
+            return np.empty((0, 4))
+        return np.vstack(edges)
+
+    def add_obstacle(self, obstacle: Loop) -> None:
+        self.particles.set_obstacles(self.obstacle_edges())
 
     def update(self) -> None:
-        global stop
+        ax, ay, stop = controls.read()
         if stop:
             print("Stop!!!")
-            stop = False
-            self.particle.stop()
+            if self.telemetry is not None:
+                self.telemetry.event(EVENT_STOP)
+            self.particles.stop()
             return
 
-        global acceleration
-        self.particle.set_accel(
-            acceleration["ax"],
-            acceleration["ay"]
-        )
-        self.particle.update(self.delta_time)
+        self.particles.set_accel(ax, ay)
+        self.particles.update(self.delta_time)
 
     def render(self) -> None:
         super().render()
-        GLUtils.draw_point(self.particle.x, self.particle.y, 5)
-
+        GLUtils.draw_point_array(self.particles.pos, size = 3)
 
-def run_flask():
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    def publish_telemetry(self, timings: tuple) -> None:
+        #Centroid of the particle cloud
+        self.telemetry.publish(
+            self.delta_time,
+            timings,
+            position = tuple(self.particles.pos.mean(axis=0))
+        )
 
 
 def main():
-    flask_thread = Thread(target=run_flask, daemon=True)
-    flask_thread.start()
+    server.run_in_thread()
 
     scene = ParticleScene("Particle", 900, 600, 20)
-    scene.run()
+    #python main.py [telemetry.log | unix:/path | tcp:host:port]
+    if len(sys.argv) > 1:
+        scene.telemetry = Telemetry(sys.argv[1])
+        scene.telemetry.launch()
+    try:
+        scene.run()
+    finally:
+        if scene.telemetry is not None:
+            scene.telemetry.close()
 
 
 if __name__ == '__main__':
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class Particle:
     def __init__(
             self,
@@ -42,3 +45,133 @@ class Particle:
         self.vy = 0
         self.ax = 0
         self.ay = 0
+
+
+class EdgeGrid:
+    #Uniform grid over the bounds; every cell lists the edges whose bounding
+    #box, grown by one cell, touches it. Rows are padded with -1 so a lookup
+    #is a single fancy index.
+    def __init__(
+            self,
+            edges: np.ndarray,
+            bounds: list = [-1, 1, 1, -1],
+            cell_size: float = 0.05
+        ) -> None:
+        self.edges = np.asarray(edges, dtype=float).reshape(-1, 4)
+        self.x0 = bounds[0]
+        self.y0 = bounds[3]
+        self.cell_size = cell_size
+        self.nx = max(1, int(np.ceil((bounds[2] - bounds[0])/cell_size)))
+        self.ny = max(1, int(np.ceil((bounds[1] - bounds[3])/cell_size)))
+
+        lo = np.minimum(self.edges[:, :2], self.edges[:, 2:])
+        hi = np.maximum(self.edges[:, :2], self.edges[:, 2:])
+        c0, r0 = self.cell(lo)
+        c1, r1 = self.cell(hi)
+        c0, r0 = np.maximum(c0 - 1, 0), np.maximum(r0 - 1, 0)
+        c1, r1 = np.minimum(c1 + 1, self.nx - 1), np.minimum(r1 + 1, self.ny - 1)
+        #Expand every edge into the cells of its bounding box
+        widths = c1 - c0 + 1
+        heights = r1 - r0 + 1
+        counts = widths*heights
+        edge_ids = np.repeat(np.arange(len(self.edges)), counts)
+        firsts = np.repeat(np.cumsum(counts) - counts, counts)
+        local = np.arange(counts.sum()) - firsts
+        cols = c0[edge_ids] + local % widths[edge_ids]
+        rows = r0[edge_ids] + local//widths[edge_ids]
+        cell_ids = rows*self.nx + cols
+
+        order = np.argsort(cell_ids, kind="stable")
+        cell_ids, edge_ids = cell_ids[order], edge_ids[order]
+        per_cell = np.bincount(cell_ids, minlength=self.nx*self.ny)
+        width = max(1, int(per_cell.max(initial=0)))
+        starts = np.cumsum(per_cell) - per_cell
+        slot = np.arange(len(cell_ids)) - starts[cell_ids]
+        self.table = np.full((self.nx*self.ny, width), -1)
+        self.table[cell_ids, slot] = edge_ids
+
+    def cell(self, points: np.ndarray) -> tuple:
+        cols = ((points[:, 0] - self.x0)/self.cell_size).astype(int)
+        rows = ((points[:, 1] - self.y0)/self.cell_size).astype(int)
+        return np.clip(cols, 0, self.nx - 1), np.clip(rows, 0, self.ny - 1)
+
+    def candidates(self, points: np.ndarray) -> np.ndarray:
+        cols, rows = self.cell(points)
+        return self.table[rows*self.nx + cols]
+
+
+class ParticleSystem:
+    #Structure of arrays: row i of pos, vel and acc is particle i
+    def __init__(
+            self,
+            n_particles: int,
+            bounds: list = [-1, 1, 1, -1],
+            rng: np.random.Generator = None
+        ) -> None:
+        if rng is None:
+            rng = np.random.default_rng()
+        self.bounds = bounds
+        self.low = np.array([bounds[0], bounds[3]])
+        self.high = np.array([bounds[2], bounds[1]])
+        self.pos = rng.uniform(self.low, self.high, (n_particles, 2))
+        self.vel = np.zeros((n_particles, 2))
+        self.acc = np.zeros((n_particles, 2))
+        self.grid = None
+
+    def set_obstacles(self, edges: np.ndarray) -> None:
+        if len(edges) == 0:
+            self.grid = None
+            return
+        self.grid = EdgeGrid(edges, self.bounds)
+
+    def set_accel(self, ax: float, ay: float) -> None:
+        self.acc[:] = (ax, ay)
+
+    def update(self, dt: float) -> None:
+        new_pos = self.pos + self.vel*dt + 0.5*self.acc*dt*dt
+        self.vel += self.acc*dt
+        if self.grid is not None:
+            self.collide(new_pos)
+
+        out = (new_pos < self.low) | (new_pos > self.high)
+        self.vel[out] *= -1
+        self.pos = np.clip(new_pos, self.low, self.high)
+
+    def collide(self, new_pos: np.ndarray) -> None:
+        #Earliest crossing of the step segment with the edges listed in the
+        #cells of points sampled at most one cell apart along it
+        step = new_pos - self.pos
+        longest = np.sqrt(np.max(np.sum(step**2, axis=1), initial=0))
+        n_samples = int(np.ceil(longest/self.grid.cell_size)) + 1
+        cand = np.hstack([
+            self.grid.candidates(self.pos + f*step)
+            for f in np.linspace(0, 1, n_samples)
+        ])
+        edges = self.grid.edges[cand]
+        p = self.pos[:, None, :]
+        r = (new_pos - self.pos)[:, None, :]
+        q = edges[..., :2]
+        s = edges[..., 2:] - q
+        qp = q - p
+        denom = r[..., 0]*s[..., 1] - r[..., 1]*s[..., 0]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = (qp[..., 0]*s[..., 1] - qp[..., 1]*s[..., 0])/denom
+            u = (qp[..., 0]*r[..., 1] - qp[..., 1]*r[..., 0])/denom
+        hit = (cand >= 0) & (denom != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+        t = np.where(hit, t, np.inf)
+        first = np.argmin(t, axis=1)
+        rows = np.flatnonzero(np.isfinite(t[np.arange(len(t)), first]))
+        if len(rows) == 0:
+            return
+
+        #Stop just before the edge and mirror the velocity across it
+        t_hit = t[rows, first[rows]]
+        new_pos[rows] = self.pos[rows] + 0.99*t_hit[:, None]*r[rows, 0]
+        direction = s[rows, first[rows]]
+        direction /= np.linalg.norm(direction, axis=1, keepdims=True)
+        along = np.sum(self.vel[rows]*direction, axis=1, keepdims=True)
+        self.vel[rows] = 2*along*direction - self.vel[rows]
+
+    def stop(self) -> None:
+        self.vel[:] = 0
+        self.acc[:] = 0
@@ -0,0 +1,161 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+
+class NullStage:
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+NULL_STAGE = NullStage()
+
+
+class Stage:
+    def __init__(self, profiler: "Profiler", name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.tic = time.perf_counter_ns()
+
+    def __exit__(self, *exc) -> bool:
+        self.profiler.record(self.name, self.tic, time.perf_counter_ns())
+        return False
+
+
+class Profiler:
+    #Per-stage timers and counters grouped by frame. While disabled, stage()
+    #hands out a shared no-op context and count() returns right away.
+    def __init__(self, max_frames: int = 10000) -> None:
+        self.enabled = False
+        self.allocations = False
+        self.frames = deque(maxlen=max_frames)
+        self.events = deque(maxlen=50*max_frames)
+        self.timers = {}
+        self.counters = {}
+        self.origin = time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    def enable(self, allocations: bool = False) -> None:
+        self.enabled = True
+        self.allocations = allocations
+        if allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self) -> None:
+        self.enabled = False
+        if self.allocations and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def stage(self, name: str) -> object:
+        if not self.enabled:
+            return NULL_STAGE
+        return Stage(self, name)
+
+    def count(self, name: str, value: int = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self, name: str, tic: int, toc: int) -> None:
+        with self._lock:
+            self.timers[name] = self.timers.get(name, 0) + toc - tic
+            self.events.append((name, tic, toc, threading.get_ident()))
+
+    def end_frame(self) -> dict:
+        if not self.enabled:
+            return None
+        with self._lock:
+            frame = {
+                "time": time.perf_counter_ns(),
+                "timers_ms": {
+                    name: ns/1e6 for name, ns in self.timers.items()
+                },
+                "counters": dict(self.counters)
+            }
+            self.timers.clear()
+            self.counters.clear()
+        if self.allocations:
+            _, peak = tracemalloc.get_traced_memory()
+            frame["counters"]["alloc_peak_bytes"] = peak
+            tracemalloc.reset_peak()
+        self.frames.append(frame)
+        return frame
+
+    @property
+    def last_frame(self) -> dict:
+        if not self.frames:
+            return None
+        return self.frames[-1]
+
+    def summary(self) -> dict:
+        stages = {}
+        counters = {}
+        for frame in self.frames:
+            for name, ms in frame["timers_ms"].items():
+                stages.setdefault(name, []).append(ms)
+            for name, value in frame["counters"].items():
+                counters.setdefault(name, []).append(value)
+        return {
+            "frames": len(self.frames),
+            "stages_ms": {
+                name: {
+                    "mean": sum(values)/len(values),
+                    "max": max(values),
+                    "total": sum(values)
+                }
+                for name, values in stages.items()
+            },
+            "counters": {
+                name: {
+                    "mean": sum(values)/len(values),
+                    "max": max(values),
+                    "total": sum(values)
+                }
+                for name, values in counters.items()
+            }
+        }
+
+    def export_json(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(
+                {"summary": self.summary(), "frames": list(self.frames)},
+                f,
+                indent=2
+            )
+
+    def export_chrome_trace(self, path: str) -> None:
+        #Loadable in chrome://tracing or https://ui.perfetto.dev
+        pid = os.getpid()
+        events = [
+            {
+                "name": name,
+                "ph": "X",
+                "ts": (tic - self.origin)/1000,
+                "dur": (toc - tic)/1000,
+                "pid": pid,
+                "tid": tid
+            }
+            for name, tic, toc, tid in self.events
+        ]
+        for frame in self.frames:
+            if frame["counters"]:
+                events.append({
+                    "name": "counters",
+                    "ph": "C",
+                    "ts": (frame["time"] - self.origin)/1000,
+                    "pid": pid,
+                    "args": frame["counters"]
+                })
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events}, f)
+
+
+profiler = Profiler()
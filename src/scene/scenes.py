@@ -1,4 +1,6 @@
+import math
 import sys
+import time
 
 import pygame
 from pygame.locals import DOUBLEBUF, OPENGL
@@ -6,6 +8,13 @@ from OpenGL.GL import *
 from OpenGL.GLU import *
 import numpy as np
 
+try:
+    from scene.profiler import profiler
+    from scene.telemetry import EVENT_LOOP
+except ModuleNotFoundError:
+    from profiler import profiler
+    from telemetry import EVENT_LOOP
+
 
 class Point:
     def __init__(self, x: int, y: int) -> None:
@@ -31,16 +40,113 @@ class Line:
         self.points.append(new_point)
 
 class Loop(Line):
-    def __init__(self) -> None:
+    #Freehand stroke simplified while it is drawn. Only points that bend the
+    #stroke by more than tolerance are kept and kept points are indexed in a
+    #grid of tolerance sized cells, so closing the stroke near any earlier
+    #point is found by looking at the 3x3 cells around the pen. Skipped
+    #points are only summarized by the wedge of chord directions that keeps
+    #all of them within tolerance, so every pen event is O(1).
+    def __init__(self, tolerance: float = 0.02) -> None:
         super().__init__()
         self.looped = False
+        self.tolerance = tolerance
+        self.cells = {}
+        self.reset_wedge()
+
+    def cell(self, point: Point) -> tuple:
+        return (
+            int(np.floor(point.x/self.tolerance)),
+            int(np.floor(point.y/self.tolerance))
+        )
 
-    def is_loop(self) -> bool:
-        if not self.points:
-            return False
+    def closing_index(self, point: Point) -> int:
+        #Earliest kept point within tolerance that is not the current anchor
+        i, j = self.cell(point)
+        found = None
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                for k in self.cells.get((i + di, j + dj), ()):
+                    if k >= len(self.points) - 2:
+                        continue
+                    other = self.points[k]
+                    dist2 = (other.x - point.x)**2 + (other.y - point.y)**2
+                    if dist2 <= self.tolerance**2 and (found is None or k < found):
+                        found = k
+        return found
+
+    def reset_wedge(self) -> None:
+        #Chord directions from the anchor, as angles mod pi in [lo, hi], and
+        #the farthest skipped point from it
+        self.lo = -math.inf
+        self.hi = math.inf
+        self.reach = 0.0
+
+    def unwrap(self, angle: float) -> float:
+        #Representative of angle (mod pi) closest to the wedge
+        if math.isinf(self.lo):
+            return angle
+        middle = (self.lo + self.hi)/2
+        return angle + math.pi*round((middle - angle)/math.pi)
+
+    def skip(self, anchor: Point, point: Point) -> None:
+        #A point at distance r and angle phi is within tolerance of every
+        #chord whose direction is phi +- asin(tolerance/r) (mod pi). Each
+        #skipped point intersects the wedge with its own.
+        dx = point.x - anchor.x
+        dy = point.y - anchor.y
+        r = math.hypot(dx, dy)
+        self.reach = max(self.reach, r)
+        if r <= self.tolerance:
+            return
+        width = math.asin(self.tolerance/r)
+        center = self.unwrap(math.atan2(dy, dx))
+        self.lo = max(self.lo, center - width)
+        self.hi = min(self.hi, center + width)
+
+    def within(self, anchor: Point, point: Point) -> bool:
+        #Whether the anchor-point chord passes within tolerance of every
+        #skipped point
+        dx = point.x - anchor.x
+        dy = point.y - anchor.y
+        if dx == 0 and dy == 0:
+            return self.reach <= self.tolerance
+        return self.lo <= self.unwrap(math.atan2(dy, dx)) <= self.hi
+
+    def append(self, new_point: Point) -> None:
         if self.looped:
-            return True
-        self.looped = self.points[-1] in self.points[:-1]
+            return
+        if self.points and self.points[-1] == new_point:
+            return
+        if len(self.points) >= 3:
+            k = self.closing_index(new_point)
+            if k is not None:
+                #Keep only the closed part of the stroke
+                self.points = self.points[k:]
+                self.cells = {}
+                self.reset_wedge()
+                self.looped = True
+                return
+        if not self.points:
+            self.keep(new_point)
+            return
+        if len(self.points) == 1:
+            self.points.append(new_point)
+            return
+        #The last point is provisional until the next one bends the stroke
+        self.skip(self.points[-2], self.points[-1])
+        if self.within(self.points[-2], new_point):
+            self.points[-1] = new_point
+            return
+        self.reset_wedge()
+        provisional = self.points.pop()
+        self.keep(provisional)
+        self.points.append(new_point)
+
+    def keep(self, point: Point) -> None:
+        self.cells.setdefault(self.cell(point), []).append(len(self.points))
+        self.points.append(point)
+
+    def is_loop(self) -> bool:
         return self.looped
 
 class Scene:
@@ -55,6 +161,7 @@ class Scene:
             DOUBLEBUF | OPENGL
         )
         self.clock = pygame.time.Clock()
+        self.telemetry = None
 
     def run(self) -> None:
         self.setup()
@@ -65,18 +172,57 @@ class Scene:
                     pygame.quit()
                     sys.exit()
             self.delta_time = self.clock.tick(self.max_fps)/1000
-            self.get_inputs()
-            self.update()
-            self.render()
-
-            pygame.display.flip()
-            pygame.display.set_caption(
-                f"{self.title} ({self.clock.get_fps():.2f} fps)"
-            )
+            tic = time.perf_counter()
+            with profiler.stage("inputs"):
+                self.get_inputs()
+            inputs_toc = time.perf_counter()
+            with profiler.stage("update"):
+                self.update()
+            update_toc = time.perf_counter()
+            with profiler.stage("render"):
+                self.render()
+                if profiler.enabled:
+                    self.render_profile()
+            render_toc = time.perf_counter()
+
+            with profiler.stage("flip"):
+                pygame.display.flip()
+            if self.telemetry is not None:
+                self.publish_telemetry((
+                    1000*(inputs_toc - tic),
+                    1000*(update_toc - inputs_toc),
+                    1000*(render_toc - update_toc),
+                    1000*(time.perf_counter() - tic)
+                ))
+            caption = f"{self.title} ({self.clock.get_fps():.2f} fps)"
+            frame = profiler.end_frame()
+            if frame is not None:
+                timers = frame["timers_ms"]
+                caption += " | " + " ".join(
+                    f"{name} {ms:.1f}ms" for name, ms in timers.items()
+                )
+            pygame.display.set_caption(caption)
     
     def setup(self) -> None:
         GLUtils.init_ortho(-1, 1, 1, -1)
 
+    def render_profile(self) -> None:
+        #One bar per stage of the previous frame, full width is the frame budget
+        frame = profiler.last_frame
+        if frame is None:
+            return
+        budget_ms = 1000/self.max_fps
+        GLUtils.draw_bars(
+            [ms/budget_ms for ms in frame["timers_ms"].values()],
+            origin = (-0.98, 0.98),
+            width = 0.6,
+            height = 0.03
+        )
+
+    def publish_telemetry(self, timings: tuple) -> None:
+        #Scenes with an agent override it to add position, path and replans
+        self.telemetry.publish(self.delta_time, timings)
+
     def get_inputs(self) -> None:
         pass
 
@@ -110,6 +256,7 @@ class GLUtils:
     def draw_point(x: int, y: int, size: int, *args, **kwargs) -> None:
         color = kwargs.get("color", (1.0, 1.0, 1.0, 1.0))
 
+        profiler.count("draw_calls")
         glColor(*color)
         glPointSize(size)
         glBegin(GL_POINTS)
@@ -132,6 +279,7 @@ class GLUtils:
         color = kwargs.get("color", (0.5, 0.0, 0.0, 1))
         size = kwargs.get("size", 5)
 
+        profiler.count("draw_calls")
         glColor(*color)
         glPointSize(size)
         glBegin(GL_POINTS)
@@ -139,11 +287,70 @@ class GLUtils:
             glVertex2f(point.x, point.y)
         glEnd()
 
+    @staticmethod
+    def draw_point_array(points: np.ndarray, *args, **kwargs) -> None:
+        #All points in a single draw call from an (N, 2) array
+        color = kwargs.get("color", (0.5, 0.0, 0.0, 1))
+        size = kwargs.get("size", 5)
+        points = np.ascontiguousarray(points, dtype=np.float64)
+
+        profiler.count("draw_calls")
+        glColor(*color)
+        glPointSize(size)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(2, GL_DOUBLE, 0, points)
+        glDrawArrays(GL_POINTS, 0, len(points))
+        glDisableClientState(GL_VERTEX_ARRAY)
+
+    @staticmethod
+    def draw_segment_array(segments: np.ndarray, *args, **kwargs) -> None:
+        #(N, 4) segments as GL_LINES in a single draw call
+        color = kwargs.get("color", (0.5, 0.0, 0.0, 1))
+        size = kwargs.get("size", 1)
+        points = np.ascontiguousarray(segments, dtype=np.float64).reshape(-1, 2)
+        if len(points) == 0:
+            return
+
+        profiler.count("draw_calls")
+        glColor(*color)
+        glPointSize(size)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(2, GL_DOUBLE, 0, points)
+        glDrawArrays(GL_LINES, 0, len(points))
+        glDisableClientState(GL_VERTEX_ARRAY)
+
+    @staticmethod
+    def draw_polygon_array(
+            coords: np.ndarray,
+            offsets: np.ndarray,
+            draw_points = True,
+            *args,
+            **kwargs
+        ) -> None:
+        #Every polygon of a (coords, offsets) scene in a single draw call
+        color = kwargs.get("color", (0.1, 0.1, 0.2, 1))
+        coords = np.ascontiguousarray(coords, dtype=np.float64)
+        offsets = np.asarray(offsets)
+        if len(offsets) < 2:
+            return
+        firsts = np.ascontiguousarray(offsets[:-1], dtype=np.int32)
+        counts = np.ascontiguousarray(np.diff(offsets), dtype=np.int32)
+
+        profiler.count("draw_calls")
+        glColor(*color)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(2, GL_DOUBLE, 0, coords)
+        glMultiDrawArrays(GL_TRIANGLE_FAN, firsts, counts, len(counts))
+        glDisableClientState(GL_VERTEX_ARRAY)
+        if draw_points:
+            GLUtils.draw_point_array(coords)
+
     @staticmethod
     def draw_line(points: list, *args, **kwargs) -> None:
         color = kwargs.get("color", (0.5, 0.0, 0.0, 1))
         size = kwargs.get("size", 1)
 
+        profiler.count("draw_calls")
         glColor(*color)
         glPointSize(size)
         glBegin(GL_LINE_STRIP)
@@ -162,6 +369,7 @@ class GLUtils:
         color = kwargs.get("color", (0.1, 0.1, 0.2, 1))
         size = kwargs.get("size", 1)
 
+        profiler.count("draw_calls")
         glColor(*color)
         glPointSize(size)
         glBegin(GL_TRIANGLE_FAN)
@@ -171,24 +379,23 @@ class GLUtils:
         if draw_points:
             GLUtils.draw_points(points)
 
-
-class SvgScene(Scene):
-    def __init__(self, title: str, svg: str, max_fps: int) -> None:
-        image = Image.open(svg)
-        h, w = image.size
-        image = np.asarray(image.resize((h//5, w//5)))
-        h, w = image.shape
-        super().__init__(title, w, h, max_fps)
-        xs, ys = np.where(image == 0)
-        self.grid = image==0
-        self.contours = [
-            self.to_ortho(Point(y, x))
-            for x,y in zip(xs, ys)
-        ]
-
-    def render(self) -> None:
-        super().render()
-        GLUtils.draw_points(self.contours)
+    @staticmethod
+    def draw_bars(values: list, origin: tuple, width: float, height: float) -> None:
+        profiler.count("draw_calls")
+        x, y = origin
+        glBegin(GL_QUADS)
+        for i, value in enumerate(values):
+            if value > 1:
+                glColor(0.8, 0.2, 0.2, 1)
+            else:
+                glColor(0.2, 0.7, 0.3, 1)
+            top = y - 1.5*i*height
+            right = x + width*min(value, 1.5)
+            glVertex2f(x, top)
+            glVertex2f(right, top)
+            glVertex2f(right, top - height)
+            glVertex2f(x, top - height)
+        glEnd()
 
 
 class GLScene(Scene):
@@ -223,12 +430,13 @@ class DrawingObstacles(Scene): #To be renamed
         super().__init__(title, width, height, max_fps)
         self.obstacles = []
         self.mouse_down = False
+        self.stroke_tolerance = 0.02
 
     def get_inputs(self) -> None:
         for event in self.events:
             if event.type == pygame.MOUSEBUTTONDOWN:
                 self.mouse_down = True
-                self.obstacles.append(Loop())
+                self.obstacles.append(Loop(self.stroke_tolerance))
                 print("Staring a new line")
             elif event.type == pygame.MOUSEBUTTONUP:
                 self.mouse_down = False
@@ -244,7 +452,14 @@ class DrawingObstacles(Scene): #To be renamed
                 self.obstacles[-1].append(ortho_point)
                 if current_obstacle.is_loop():
                     print("Found loop")
+                    if self.telemetry is not None:
+                        self.telemetry.event(EVENT_LOOP)
                     self.mouse_down = False
+                    self.add_obstacle(current_obstacle)
+
+    def add_obstacle(self, obstacle: Loop) -> None:
+        #Called once per closed stroke
+        pass
 
     def render(self) -> None:
         super().render()
@@ -0,0 +1,125 @@
+import asyncio
+import json
+from threading import Thread
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    500: "Internal Server Error"
+}
+
+
+class HttpServer:
+    #Small JSON over HTTP/1.1 server on asyncio streams with keep-alive.
+    #Routes map (method, path) to coroutines taking the decoded body and
+    #returning (status, payload).
+    def __init__(self, host: str = "127.0.0.1", port: int = 5000) -> None:
+        self.host = host
+        self.port = port
+        self.routes = {}
+        self.server = None
+
+    def route(self, method: str, path: str) -> callable:
+        def register(handler: callable) -> callable:
+            self.routes[(method, path)] = handler
+            return handler
+        return register
+
+    async def handle(
+            self,
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter
+        ) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                raw = await reader.readexactly(length) if length else b""
+
+                status, payload = await self.dispatch(method, path, raw)
+                body = json.dumps(payload).encode()
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                    f"\r\n".encode() + body
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method: str, path: str, raw: bytes) -> tuple:
+        handler = self.routes.get((method, path.split("?", 1)[0]))
+        if handler is None:
+            return 404, {"error": f"{method} {path} not found"}
+        try:
+            data = json.loads(raw) if raw else {}
+            return await handler(data)
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, {"error": str(e)}
+        except Exception as e:
+            return 500, {"error": str(e)}
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def run_in_thread(self) -> Thread:
+        thread = Thread(
+            target=lambda: asyncio.run(self.serve_forever()),
+            daemon=True
+        )
+        thread.start()
+        return thread
+
+
+async def request(
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        method: str,
+        path: str,
+        payload: dict = None
+    ) -> tuple:
+    #Client side of one keep-alive request
+    body = json.dumps(payload).encode() if payload is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\n"
+        f"Host: localhost\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"\r\n".encode() + body
+    )
+    await writer.drain()
+    status_line = await reader.readline()
+    status = int(status_line.split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        key, _, value = line.decode("latin-1").partition(":")
+        if key.strip().lower() == "content-length":
+            length = int(value)
+    raw = await reader.readexactly(length)
+    return status, json.loads(raw) if raw else None
@@ -0,0 +1,211 @@
+import json
+import os
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+MAGIC = b"VGTELEM1"
+MAX_PATH_POINTS = 32
+
+EVENT_REPLAN = 1
+EVENT_LOOP = 2
+EVENT_STOP = 4
+EVENT_ARRIVED = 8
+
+RECORD = np.dtype([
+    ("frame", "<u8"),
+    ("time", "<f8"),
+    ("dt", "<f4"),
+    ("inputs_ms", "<f4"),
+    ("update_ms", "<f4"),
+    ("render_ms", "<f4"),
+    ("frame_ms", "<f4"),
+    ("x", "<f4"),
+    ("y", "<f4"),
+    ("replans", "<u4"),
+    ("events", "<u4"),
+    ("dropped", "<u8"),
+    ("n_path", "<u2"),
+    ("path", "<f4", (MAX_PATH_POINTS, 2))
+])
+
+
+class RingBuffer:
+    #Single producer, single consumer. The producer only moves head and the
+    #consumer only moves tail, so neither takes a lock; when the buffer is
+    #full new records are dropped instead of waiting for the consumer.
+    def __init__(self, capacity: int = 4096, dtype: np.dtype = RECORD) -> None:
+        self.capacity = capacity
+        self.records = np.zeros(capacity, dtype=dtype)
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return self.head - self.tail
+
+    def slot(self) -> np.void:
+        #Next free record, or None when full. Publish it with commit().
+        if self.head - self.tail >= self.capacity:
+            self.dropped += 1
+            return None
+        return self.records[self.head % self.capacity]
+
+    def commit(self) -> None:
+        self.head += 1
+
+    def drain(self) -> np.ndarray:
+        #Copy of every committed record, oldest first
+        head = self.head
+        tail = self.tail
+        if head == tail:
+            return self.records[:0].copy()
+        a = tail % self.capacity
+        b = head % self.capacity
+        if a < b:
+            chunk = self.records[a:b].copy()
+        else:
+            chunk = np.concatenate([self.records[a:], self.records[:b]])
+        self.tail = head
+        return chunk
+
+
+def header(dtype: np.dtype = RECORD) -> bytes:
+    meta = json.dumps({
+        "descr": np.lib.format.dtype_to_descr(dtype),
+        "max_path_points": MAX_PATH_POINTS
+    }).encode()
+    return MAGIC + struct.pack("<I", len(meta)) + meta
+
+
+def open_sink(target: str) -> object:
+    #unix:/path or tcp:host:port stream to a socket, anything else is a file
+    if target.startswith("unix:"):
+        sink = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sink.connect(target[5:])
+        return sink.makefile("wb")
+    if target.startswith("tcp:"):
+        host, port = target[4:].rsplit(":", 1)
+        sink = socket.create_connection((host, int(port)))
+        return sink.makefile("wb")
+    return open(target, "wb")
+
+
+class Telemetry:
+    #Frame records go into a ring buffer from the simulation loop and a
+    #background thread writes them out every interval seconds. A slow sink
+    #only fills the ring, the loop never waits for it.
+    def __init__(
+            self,
+            target: str,
+            capacity: int = 4096,
+            interval: float = 0.1
+        ) -> None:
+        self.target = target
+        self.ring = RingBuffer(capacity)
+        self.interval = interval
+        self.origin = time.perf_counter()
+        self.frame = 0
+        self.events = 0
+        self.written = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._sink = None
+
+    def launch(self) -> None:
+        self._sink = open_sink(self.target)
+        self._sink.write(header(self.ring.records.dtype))
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def event(self, flag: int) -> None:
+        #Flags are attached to the next published frame
+        self.events |= flag
+
+    def publish(
+            self,
+            dt: float,
+            timings: tuple,
+            position: tuple = None,
+            path: np.ndarray = None,
+            replans: int = 0
+        ) -> None:
+        record = self.ring.slot()
+        self.frame += 1
+        if record is None:
+            return
+        record["frame"] = self.frame
+        record["time"] = time.perf_counter() - self.origin
+        record["dt"] = dt
+        (
+            record["inputs_ms"],
+            record["update_ms"],
+            record["render_ms"],
+            record["frame_ms"]
+        ) = timings
+        if position is None:
+            record["x"] = record["y"] = np.nan
+        else:
+            record["x"], record["y"] = position
+        record["replans"] = replans
+        record["events"] = self.events
+        record["dropped"] = self.ring.dropped
+        if path is None:
+            record["n_path"] = 0
+        else:
+            n_path = min(len(path), MAX_PATH_POINTS)
+            record["n_path"] = n_path
+            record["path"][:n_path] = path[:n_path]
+        self.events = 0
+        self.ring.commit()
+
+    def flush(self) -> None:
+        chunk = self.ring.drain()
+        if len(chunk):
+            self._sink.write(chunk.tobytes())
+            self._sink.flush()
+            self.written += len(chunk)
+
+    def run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except OSError:
+                #Consumer went away, keep the loop running without telemetry
+                break
+
+    def close(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        try:
+            self.flush()
+            self._sink.close()
+        except OSError:
+            pass
+        self._thread = None
+
+
+def read_log(path: str) -> np.ndarray:
+    with open(path, "rb") as f:
+        magic = f.read(len(MAGIC))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a telemetry log")
+        (size,) = struct.unpack("<I", f.read(4))
+        meta = json.loads(f.read(size))
+        offset = f.tell()
+    dtype = np.lib.format.descr_to_dtype(meta["descr"])
+    n_records = (os.path.getsize(path) - offset)//dtype.itemsize
+    if n_records == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(
+        path,
+        dtype=dtype,
+        mode="r",
+        offset=offset,
+        shape=(n_records,)
+    )
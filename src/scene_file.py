@@ -0,0 +1,212 @@
+import json
+from argparse import ArgumentParser
+from types import SimpleNamespace
+
+import numpy as np
+
+from shapes import Polygon
+from geometry import clockwise, polygon_edges
+from raster import load_grid, raster_polygons
+
+#Layout: header, int64 offsets[n_polygons + 1], float64 coords[n_points][2]
+MAGIC = b"VGSCENE1"
+HEADER = np.dtype([
+    ("magic", "S8"),
+    ("n_polygons", "<u8"),
+    ("n_points", "<u8")
+])
+
+default_polygons = [
+    Polygon([[-0.8, 0.2], [-0.6, 0.6], [-0.5, 0.4], [-0.15, 0.27]]),
+    Polygon([[-0.5, -0.6], [-0.8, -0.6], [-0.2, -0.4], [-0.46, -0.92]]),
+    Polygon([[0.33, -0.12], [0, -0.2], [0.2, 0.2], [0.4, 0.04], [0.8, 0.2], [0.62, -0.27]])
+]
+
+
+class SceneData:
+    def __init__(self, coords: np.ndarray, offsets: np.ndarray) -> None:
+        self.coords = coords
+        self.offsets = offsets
+        self._polygons = None
+
+    @classmethod
+    def from_polygons(cls, polygons: list) -> "SceneData":
+        sizes = [polygon.len for polygon in polygons]
+        offsets = np.zeros(len(polygons) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        coords = np.array(
+            [[point.x, point.y] for polygon in polygons for point in polygon.points],
+            dtype=np.float64
+        ).reshape(-1, 2)
+        data = cls(coords, offsets)
+        data._polygons = polygons
+        return data
+
+    @classmethod
+    def from_rings(cls, rings: list) -> "SceneData":
+        rings = [clockwise(ring) for ring in rings if len(ring) >= 3]
+        offsets = np.zeros(len(rings) + 1, dtype=np.int64)
+        np.cumsum([len(ring) for ring in rings], out=offsets[1:])
+        coords = np.vstack(rings) if rings else np.empty((0, 2))
+        return cls(coords.astype(np.float64), offsets)
+
+    @classmethod
+    def load(cls, path: str) -> "SceneData":
+        header = np.fromfile(path, dtype=HEADER, count=1)[0]
+        if header["magic"] != MAGIC:
+            raise RuntimeError(f"{path} is not a scene file")
+        n_polygons = int(header["n_polygons"])
+        n_points = int(header["n_points"])
+        offsets = np.memmap(
+            path,
+            dtype="<i8",
+            mode="r",
+            offset=HEADER.itemsize,
+            shape=(n_polygons + 1,)
+        )
+        coords = np.memmap(
+            path,
+            dtype="<f8",
+            mode="r",
+            offset=HEADER.itemsize + offsets.nbytes,
+            shape=(n_points, 2)
+        )
+        return cls(coords, offsets)
+
+    def save(self, path: str) -> None:
+        header = np.array(
+            [(MAGIC, self.n_polygons, self.n_points)],
+            dtype=HEADER
+        )
+        with open(path, "wb") as f:
+            header.tofile(f)
+            np.ascontiguousarray(self.offsets, dtype="<i8").tofile(f)
+            np.ascontiguousarray(self.coords, dtype="<f8").tofile(f)
+
+    @property
+    def n_polygons(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def n_points(self) -> int:
+        return len(self.coords)
+
+    @property
+    def polygons(self) -> list:
+        #Point objects are only created when something asks for them
+        if self._polygons is None:
+            self._polygons = [
+                Polygon(self.coords[a:b].tolist())
+                for a, b in zip(self.offsets[:-1], self.offsets[1:])
+            ]
+        return self._polygons
+
+    def vertex_array(self) -> np.ndarray:
+        return self.coords
+
+    def edge_array(self) -> np.ndarray:
+        return polygon_edges(self.coords, self.offsets)
+
+    def append(self, polygon: Polygon) -> "SceneData":
+        #New scene with one more polygon, the arrays are copied once
+        coords = np.vstack([self.coords, polygon.array()])
+        offsets = np.append(self.offsets, self.offsets[-1] + polygon.len)
+        data = SceneData(coords, offsets)
+        if self._polygons is not None:
+            data._polygons = self._polygons + [polygon]
+        return data
+
+    def fit(self, margin: float = 0.05) -> "SceneData":
+        #Scales the scene into the [-1, 1] view keeping its aspect ratio
+        low = self.coords.min(axis=0)
+        high = self.coords.max(axis=0)
+        center = (low + high)/2
+        scale = (2 - 2*margin)/max(np.max(high - low), np.finfo(float).tiny)
+        return SceneData((self.coords - center)*scale, np.array(self.offsets))
+
+
+def read_wkt(text: str) -> SceneData:
+    #POLYGON and MULTIPOLYGON outer rings; holes are ignored
+    rings = []
+    start = None
+    ring_no = 0
+    for i, char in enumerate(text):
+        if char == "(":
+            start = i + 1
+        elif char == ")":
+            if start is None:
+                ring_no = 0
+                continue
+            if ring_no == 0:
+                values = text[start:i].replace(",", " ").split()
+                rings.append(np.array(values, dtype=float).reshape(-1, 2))
+            ring_no += 1
+            start = None
+    return SceneData.from_rings([open_ring(ring) for ring in rings])
+
+def read_geojson(data: dict) -> SceneData:
+    rings = []
+    pending = [data]
+    while pending:
+        item = pending.pop()
+        kind = item.get("type")
+        if kind == "FeatureCollection":
+            pending.extend(reversed(item["features"]))
+        elif kind == "Feature":
+            pending.append(item["geometry"])
+        elif kind == "GeometryCollection":
+            pending.extend(reversed(item["geometries"]))
+        elif kind == "Polygon":
+            rings.append(item["coordinates"][0])
+        elif kind == "MultiPolygon":
+            rings.extend(polygon[0] for polygon in item["coordinates"])
+    return SceneData.from_rings([
+        open_ring(np.array(ring, dtype=float)[:, :2]) for ring in rings
+    ])
+
+def open_ring(ring: np.ndarray) -> np.ndarray:
+    if len(ring) > 1 and np.all(ring[0] == ring[-1]):
+        return ring[:-1]
+    return ring
+
+def load_scene(path: str) -> SceneData:
+    if path.endswith(".wkt"):
+        with open(path) as f:
+            return read_wkt(f.read())
+    if path.endswith(".geojson") or path.endswith(".json"):
+        with open(path) as f:
+            return read_geojson(json.load(f))
+    return SceneData.load(path)
+
+def headless_scene(args: object) -> SimpleNamespace:
+    #--scene, --map or the default polygons as a planner scene. Only arrays,
+    #the planner never needs the Polygon objects
+    if args.scene is not None:
+        data = load_scene(args.scene)
+    elif args.map is not None:
+        data = SceneData.from_polygons(raster_polygons(load_grid(args.map)))
+    else:
+        data = SceneData.from_polygons(default_polygons)
+    return SimpleNamespace(scene_data=data)
+
+
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("source", help = "Escena .wkt, .geojson o binaria")
+    parser.add_argument("target", help = "Archivo binario de salida")
+    parser.add_argument(
+        "--fit",
+        action = "store_true",
+        help = "Escala la escena a la ventana [-1, 1]"
+    )
+    args = parser.parse_args()
+
+    data = load_scene(args.source)
+    if args.fit:
+        data = data.fit()
+    data.save(args.target)
+    print(f"{data.n_polygons} polygons, {data.n_points} vertices")
+
+
+if __name__ == '__main__':
+    main()
@@ -41,6 +41,9 @@ class Polygon:
             raise RuntimeError("Not recgonized data type")
         self.len = len(self.points)
 
+    def array(self) -> np.ndarray:
+        return np.array([[point.x, point.y] for point in self.points])
+
     def draw(self) -> None:
         GLUtils.draw_polygon(self.points)
 
@@ -0,0 +1,352 @@
+import numpy as np
+
+from geometry import neighbour_indices, segment_lengths
+from scene_file import SceneData
+from scene.profiler import profiler
+import kernels
+
+
+class SweepEdge:
+    #Obstacle edge oriented counterclockwise around the query point. Edges
+    #in the active list never cross, so "in front of" is a consistent order
+    #for every ray that hits both of them. Plain floats, this is the hot loop.
+    def __init__(self, point: tuple, edge: list, inner: bool = False) -> None:
+        self.px, self.py = point
+        self.ax, self.ay, self.bx, self.by = edge
+        #Whether the point is on the obstacle side of the edge
+        self.inner = inner
+        #Position in the ActiveEdges heap
+        self.slot = -1
+
+    def left_of(self, x: float, y: float) -> bool:
+        return (
+            (self.bx - self.ax)*(y - self.ay) -
+            (self.by - self.ay)*(x - self.ax)
+        ) > 0
+
+    def __lt__(self, other: "SweepEdge") -> bool:
+        dx, dy = other.bx - other.ax, other.by - other.ay
+        a1 = self.left_of(other.ax + 0.01*dx, other.ay + 0.01*dy)
+        a2 = self.left_of(other.ax + 0.99*dx, other.ay + 0.99*dy)
+        a3 = self.left_of(self.px, self.py)
+        #Closer when the other edge lies beyond this one
+        if a1 == a2 and a2 != a3:
+            return True
+        dx, dy = self.bx - self.ax, self.by - self.ay
+        b1 = other.left_of(self.ax + 0.01*dx, self.ay + 0.01*dy)
+        b2 = other.left_of(self.ax + 0.99*dx, self.ay + 0.99*dy)
+        b3 = other.left_of(self.px, self.py)
+        #or this one lies on the query point's side of the other
+        return b1 == b2 and b2 == b3
+
+    def ray_hit(self, dx: float, dy: float) -> float:
+        #t such that point + t*(dx, dy) lies on the edge's line
+        ex, ey = self.bx - self.ax, self.by - self.ay
+        apx, apy = self.ax - self.px, self.ay - self.py
+        denom = dx*ey - dy*ex
+        if denom == 0:
+            norm = dx*dx + dy*dy
+            return min(
+                apx*dx + apy*dy,
+                (self.bx - self.px)*dx + (self.by - self.py)*dy
+            )/norm
+        return (apx*ey - apy*ex)/denom
+
+
+class ActiveEdges:
+    #Binary heap of the edges crossing the sweep ray, nearest on top. Each
+    #edge knows its slot, so removing it is O(log n) like pushing it, and
+    #edges are only ever compared with other active ones.
+    def __init__(self) -> None:
+        self.heap = []
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def top(self) -> SweepEdge:
+        return self.heap[0] if self.heap else None
+
+    def push(self, edge: SweepEdge) -> None:
+        edge.slot = len(self.heap)
+        self.heap.append(edge)
+        self.sift_up(edge.slot)
+
+    def remove(self, edge: SweepEdge) -> None:
+        last = self.heap.pop()
+        if last is edge:
+            return
+        last.slot = edge.slot
+        self.heap[last.slot] = last
+        self.sift_up(last.slot)
+        self.sift_down(last.slot)
+
+    def sift_up(self, slot: int) -> None:
+        heap = self.heap
+        edge = heap[slot]
+        while slot > 0:
+            parent = (slot - 1) >> 1
+            if not edge < heap[parent]:
+                break
+            heap[slot] = heap[parent]
+            heap[slot].slot = slot
+            slot = parent
+        heap[slot] = edge
+        edge.slot = slot
+
+    def sift_down(self, slot: int) -> None:
+        heap = self.heap
+        n = len(heap)
+        edge = heap[slot]
+        while True:
+            child = 2*slot + 1
+            if child >= n:
+                break
+            if child + 1 < n and heap[child + 1] < heap[child]:
+                child += 1
+            if not heap[child] < edge:
+                break
+            heap[slot] = heap[child]
+            heap[slot].slot = slot
+            slot = child
+        heap[slot] = edge
+        edge.slot = slot
+
+
+def box_edges(bounds: tuple) -> np.ndarray:
+    x_min, x_max, y_min, y_max = bounds
+    corners = np.array([
+        [x_min, y_min],
+        [x_min, y_max],
+        [x_max, y_max],
+        [x_max, y_min]
+    ])
+    return np.hstack([corners, np.roll(corners, -1, axis=0)])
+
+
+def scene_bounds(
+        edges: np.ndarray,
+        points: np.ndarray,
+        margin: float = 0.1
+    ) -> tuple:
+    #The [-1, 1] view grown to hold every edge and query point
+    coords = np.vstack([edges[:, :2], points, [[-1, -1], [1, 1]]])
+    low = coords.min(axis=0) - margin
+    high = coords.max(axis=0) + margin
+    return low[0], high[0], low[1], high[1]
+
+
+def sweep(
+        point: np.ndarray,
+        edges: np.ndarray,
+        edge_vertices: np.ndarray,
+        n_vertices: int
+    ) -> tuple:
+    #Angular sweep around point. Returns the visibility polygon (clockwise,
+    #like the obstacles) and a mask of the vertices it can see; a vertex is
+    #seen when no edge crossing its ray, other than its own, is closer.
+    #A point inside an obstacle sees nothing.
+    rel = edges - np.tile(point, 2)
+    cross = rel[:, 0]*rel[:, 3] - rel[:, 1]*rel[:, 2]
+    keep = cross != 0
+    rel, edges, edge_vertices = rel[keep], edges[keep], edge_vertices[keep]
+    swap = cross[keep] < 0
+    #Clockwise obstacles: the point is on their side of the swapped edges
+    inner = swap & (edge_vertices[:, 0] >= 0)
+    edges[swap] = edges[swap][:, [2, 3, 0, 1]]
+    rel[swap] = rel[swap][:, [2, 3, 0, 1]]
+    edge_vertices[swap] = edge_vertices[swap][:, ::-1]
+
+    start_angles = np.arctan2(rel[:, 1], rel[:, 0])
+    end_angles = np.arctan2(rel[:, 3], rel[:, 2])
+    start_angles[start_angles == -np.pi] = np.pi
+    end_angles[end_angles == -np.pi] = np.pi
+    #Only edges across the -pi ray really wrap. Other inverted ones are
+    #nearly in line with the point and rounding swapped their ends: they
+    #cover no angle, drop them.
+    inverted = start_angles >= end_angles
+    wraps = inverted & (start_angles - end_angles > np.pi)
+    keep = ~inverted | wraps
+    edges, rel, edge_vertices = edges[keep], rel[keep], edge_vertices[keep]
+    start_angles, end_angles = start_angles[keep], end_angles[keep]
+    wraps, inner = wraps[keep], inner[keep]
+
+    #Events sorted by angle, ends before starts at the same angle. Edges
+    #across the -pi ray start active, end first and come back at their start.
+    n_edges = len(edges)
+    angles = np.r_[start_angles, end_angles]
+    kinds = np.r_[np.ones(n_edges, dtype=int), np.zeros(n_edges, dtype=int)]
+    order = np.lexsort((kinds, angles))
+
+    px, py = point.tolist()
+    sweep_edges = [
+        SweepEdge((px, py), edge, flag)
+        for edge, flag in zip(edges.tolist(), inner.tolist())
+    ]
+    active = ActiveEdges()
+    for i in np.flatnonzero(wraps).tolist():
+        active.push(sweep_edges[i])
+    if active and active.top().inner:
+        #The nearest edge along the -pi ray has the point on its obstacle
+        #side: the point is inside that obstacle
+        return np.empty((0, 2)), np.zeros(n_vertices, dtype=bool)
+
+    angles = angles.tolist()
+    order = order.tolist()
+    rel = rel.tolist()
+    edge_vertices = edge_vertices.tolist()
+    visible = np.zeros(n_vertices, dtype=bool)
+    boundary = []
+    k = 0
+    while k < len(order):
+        #Every event at this exact angle
+        group = [order[k]]
+        k += 1
+        while k < len(order) and angles[order[k]] == angles[group[0]]:
+            group.append(order[k])
+            k += 1
+        ends = [e - n_edges for e in group if e >= n_edges]
+        starts = [e for e in group if e < n_edges]
+
+        first = group[0]
+        if first < n_edges:
+            dx, dy = rel[first][0], rel[first][1]
+        else:
+            dx, dy = rel[first - n_edges][2], rel[first - n_edges][3]
+        norm = dx*dx + dy*dy
+        nearest_before = active.top()
+
+        for i in ends:
+            active.remove(sweep_edges[i])
+
+        #Vertices on this ray against the edges that cross it
+        through = active.top().ray_hit(dx, dy) if active else np.inf
+        for i in starts:
+            vertex = edge_vertices[i][0]
+            if vertex >= 0:
+                t = (rel[i][0]*dx + rel[i][1]*dy)/norm
+                visible[vertex] |= t <= through*(1 + 1e-12)
+        for i in ends:
+            vertex = edge_vertices[i][1]
+            if vertex >= 0:
+                t = (rel[i][2]*dx + rel[i][3]*dy)/norm
+                visible[vertex] |= t <= through*(1 + 1e-12)
+
+        for i in starts:
+            active.push(sweep_edges[i])
+        nearest_after = active.top()
+
+        if nearest_before is not nearest_after:
+            for edge in (nearest_before, nearest_after):
+                if edge is None:
+                    continue
+                t = edge.ray_hit(dx, dy)
+                hit = (px + t*dx, py + t*dy)
+                if not boundary or boundary[-1] != hit:
+                    boundary.append(hit)
+
+    boundary = np.array(boundary).reshape(-1, 2)
+    if len(boundary) > 1 and np.all(boundary[0] == boundary[-1]):
+        boundary = boundary[:-1]
+    return boundary[::-1], visible
+
+
+def degenerate_vertices(
+        points: np.ndarray,
+        coords: np.ndarray,
+        offsets: np.ndarray,
+        tolerance: float = 1e-9
+    ) -> np.ndarray:
+    #(len(points), len(coords)) mask of the vertices the sweep cannot decide
+    #exactly: on the query point, on the ray of another vertex or on an edge
+    #whose line passes through the point, both within tolerance radians.
+    #Float angles do not order such vertices reliably.
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    coords = np.asarray(coords, dtype=float)
+    _, nxt = neighbour_indices(offsets)
+    rel = coords[None, :, :] - points[:, None, :]
+    angles = np.arctan2(rel[..., 1], rel[..., 0])
+    order = np.argsort(angles, axis=1)
+    sorted_angles = np.take_along_axis(angles, order, axis=1)
+    gaps = np.diff(sorted_angles, axis=1, append=sorted_angles[:, :1] + 2*np.pi)
+    close = gaps < tolerance
+    crowded = close | np.roll(close, 1, axis=1)
+    degenerate = np.zeros(angles.shape, dtype=bool)
+    np.put_along_axis(degenerate, order, crowded, axis=1)
+
+    on_point = (rel[..., 0] == 0) & (rel[..., 1] == 0)
+    norms = np.hypot(rel[..., 0], rel[..., 1])
+    cross = rel[..., 0]*rel[:, nxt, 1] - rel[..., 1]*rel[:, nxt, 0]
+    through = np.abs(cross) <= tolerance*norms*norms[:, nxt]
+    degenerate |= on_point | through
+    degenerate[:, nxt] |= through
+    #A point on an obstacle side sees into it, the sweep cannot tell
+    between = np.sum(rel*rel[:, nxt], axis=2) <= 0
+    degenerate[np.any(through & between, axis=1)] = True
+    return degenerate
+
+
+def visibility_polygons(
+        points: np.ndarray,
+        coords: np.ndarray,
+        offsets: np.ndarray,
+        bounds: tuple = None
+    ) -> tuple:
+    #Visibility polygon of every query point against the obstacles given as
+    #SceneData arrays, clipped to bounds. Returns the polygons as SceneData
+    #(one ring per point) and a (len(points), n_vertices) visibility mask.
+    #Obstacles must not overlap, merge them first (ObstaclePreprocessor).
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    coords = np.asarray(coords, dtype=float)
+    _, nxt = neighbour_indices(offsets)
+    edges = np.hstack([coords, coords[nxt]])
+    edge_vertices = np.column_stack([np.arange(len(coords)), nxt])
+    if bounds is None:
+        bounds = scene_bounds(edges, points)
+    edges = np.vstack([edges, box_edges(bounds)])
+    edge_vertices = np.vstack([edge_vertices, np.full((4, 2), -1)])
+
+    rings = []
+    visible = np.zeros((len(points), len(coords)), dtype=bool)
+    with profiler.stage("visibility_sweep"):
+        for q, point in enumerate(points):
+            ring, visible[q] = sweep(point, edges, edge_vertices, len(coords))
+            rings.append(ring)
+    profiler.count("visibility_queries", len(points))
+
+    ring_offsets = np.zeros(len(rings) + 1, dtype=np.int64)
+    np.cumsum([len(ring) for ring in rings], out=ring_offsets[1:])
+    ring_coords = np.vstack(rings) if rings else np.empty((0, 2))
+    return SceneData(ring_coords, ring_offsets), visible
+
+
+def visible_rows(
+        points: np.ndarray,
+        coords: np.ndarray,
+        offsets: np.ndarray,
+        vertex_ids: np.ndarray,
+        edges: np.ndarray,
+        overlapping: bool = False,
+        visible: np.ndarray = None
+    ) -> np.ndarray:
+    #Length from every point to each vertex coords[vertex_ids] it sees, -1
+    #elsewhere: the rows segments_free gives against edges. The sweep
+    #decides every vertex except the degenerate ones, which go through the
+    #segment predicate; all of them when the obstacles overlap.
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    coords = np.asarray(coords, dtype=float)
+    if visible is None:
+        _, visible = visibility_polygons(points, coords, offsets)
+        visible = visible[:, vertex_ids]
+    segments = np.empty((len(points), len(vertex_ids), 4))
+    segments[..., :2] = points[:, None, :]
+    segments[..., 2:] = coords[vertex_ids][None, :, :]
+    lengths = segment_lengths(segments.reshape(-1, 4)).reshape(visible.shape)
+    rows = np.where(visible, lengths, -1)
+    if overlapping:
+        degenerate = np.ones(visible.shape, dtype=bool)
+    else:
+        degenerate = degenerate_vertices(points, coords, offsets)[:, vertex_ids]
+    retest = segments[degenerate]
+    free = kernels.backend.segments_free(retest, edges)
+    rows[degenerate] = np.where(free, lengths[degenerate], -1)
+    return rows
@@ -0,0 +1,129 @@
+import os
+import sys
+from fractions import Fraction
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+#Modules import each other from src, as when running the scripts there
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from scene.scenes import Point
+from planner import VisibilityGraphPlanner
+from polygon_scene import default_polygons
+from geometry import points_in_polygon
+import kernels
+
+
+class CountingPlanner(VisibilityGraphPlanner):
+    #No path to goals right of the window, every search is counted
+    def get_shortest_path(self, *args, **kwargs):
+        self.searches = getattr(self, "searches", 0) + 1
+        if self._goal.x > 1:
+            raise ValueError("No path exists.")
+        return super().get_shortest_path(*args, **kwargs)
+
+def rectangles_grid(seed: int, n_rectangles: int = 40) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    grid = np.zeros((100, 100), dtype=bool)
+    for _ in range(n_rectangles):
+        x, y = rng.integers(0, 90, 2)
+        w, h = rng.integers(2, 10, 2)
+        grid[y:y + h, x:x + w] = True
+    return grid
+
+def strictly_inside_obstacles(points: np.ndarray, polygons: list) -> np.ndarray:
+    #Strictly inside: every nearby point is inside too, so points on the
+    #boundary do not count
+    inside = np.zeros(len(points), dtype=bool)
+    for polygon in polygons:
+        strict = np.ones(len(points), dtype=bool)
+        for offset in ([1e-7, 0], [-1e-7, 0], [0, 1e-7], [0, -1e-7]):
+            strict &= points_in_polygon(points + offset, polygon.array())
+        inside |= strict
+    return inside
+
+
+def cross(o: tuple, a: tuple, b: tuple) -> Fraction:
+    return (a[0] - o[0])*(b[1] - o[1]) - (a[1] - o[1])*(b[0] - o[0])
+
+def strictly_inside(point: tuple, ring: list) -> bool:
+    #Even-odd rule in exact arithmetic, points on the boundary are outside
+    x, y = point
+    inside = False
+    for a, b in zip(ring, ring[1:] + ring[:1]):
+        if cross(a, b, point) == 0 and (
+                min(a[0], b[0]) <= x <= max(a[0], b[0]) and
+                min(a[1], b[1]) <= y <= max(a[1], b[1])
+            ):
+            return False
+        if (a[1] > y) != (b[1] > y):
+            if x < a[0] + (y - a[1])*(b[0] - a[0])/(b[1] - a[1]):
+                inside = not inside
+    return inside
+
+def exact_rings(data: object) -> list:
+    coords = np.asarray(data.coords)
+    return [
+        [(Fraction(x), Fraction(y)) for x, y in coords[a:b].tolist()]
+        for a, b in zip(data.offsets[:-1], data.offsets[1:])
+    ]
+
+def exactly_free(p: np.ndarray, q: np.ndarray, rings: list) -> bool:
+    #Reference for segments_free: splits pq wherever it meets an obstacle
+    #boundary and checks that no piece runs through an obstacle interior
+    p = tuple(map(Fraction, p))
+    q = tuple(map(Fraction, q))
+    dx, dy = q[0] - p[0], q[1] - p[1]
+    length = dx*dx + dy*dy
+    cuts = {Fraction(0), Fraction(1)}
+    for ring in rings:
+        for a, b in zip(ring, ring[1:] + ring[:1]):
+            ex, ey = b[0] - a[0], b[1] - a[1]
+            denom = dx*ey - dy*ex
+            ax, ay = a[0] - p[0], a[1] - p[1]
+            if denom != 0:
+                t = (ax*ey - ay*ex)/denom
+                u = (ax*dy - ay*dx)/denom
+                if 0 <= t <= 1 and 0 <= u <= 1:
+                    cuts.add(t)
+            elif length:
+                for v in (a, b):
+                    if cross(p, q, v) == 0:
+                        t = ((v[0] - p[0])*dx + (v[1] - p[1])*dy)/length
+                        if 0 <= t <= 1:
+                            cuts.add(t)
+    cuts = sorted(cuts)
+    for t0, t1 in zip(cuts[:-1], cuts[1:]):
+        t = (t0 + t1)/2
+        middle = (p[0] + t*dx, p[1] + t*dy)
+        if any(strictly_inside(middle, ring) for ring in rings):
+            return False
+    return True
+
+
+@pytest.fixture
+def exact():
+    #Exact visibility for small scenes: exact.free(p, q, exact.rings(data))
+    return SimpleNamespace(rings=exact_rings, free=exactly_free)
+
+@pytest.fixture(params = kernels.available())
+def backend(request):
+    previous = kernels.backend
+    yield kernels.use(request.param)
+    kernels.backend = previous
+
+@pytest.fixture
+def rectangles_map():
+    #Occupancy grid of random rectangles: rectangles_map(seed)
+    return rectangles_grid
+
+@pytest.fixture
+def inside_obstacles():
+    return strictly_inside_obstacles
+
+@pytest.fixture
+def counting_planner():
+    scene = SimpleNamespace(polygons=list(default_polygons))
+    return CountingPlanner(scene, Point(-0.9, 0.9), Point(0.9, 0.9))
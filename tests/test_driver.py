@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from scene.scenes import Point
+from shapes import Polygon
+from driver import ConstantVelocityParticle, simulate_missions
+
+
+def test_late_path_keeps_position(counting_planner):
+    #A threaded plan requested at the start arrives after the particle moved
+    planner = counting_planner
+    driver = ConstantVelocityParticle(planner)
+    for _ in range(10):
+        driver.update(0.05)
+    before = np.array([driver.position.x, driver.position.y])
+    planner.plan(Point(-0.9, 0.9), Point(0.9, -0.9))
+    driver.update(0.0)
+    after = np.array([driver.position.x, driver.position.y])
+    _, dist = driver.trajectory.project(before)
+    assert np.hypot(*(after - before)) == dist
+    assert np.hypot(after[0] + 0.9, after[1] - 0.9) > 0.1
+
+def test_moved_particle_waits_for_its_path(counting_planner):
+    planner = counting_planner
+    driver = ConstantVelocityParticle(planner)
+    planner.plan = lambda start, goal: planner.shortest_path
+    driver.position = Point(0.0, -0.95)
+    driver.update(0.05)
+    assert (driver.position.x, driver.position.y) == (0.0, -0.95)
+
+def test_one_search_per_mission(counting_planner):
+    planner = counting_planner
+    searches = planner.searches
+    missions = np.array([
+        [-0.9, -0.9, 0.9, 0.9],
+        [0.9, -0.9, -0.9, 0.9],
+        [-0.9, 0.0, 0.9, 0.0]
+    ])
+    trajectories = simulate_missions(planner, missions)
+    assert planner.searches == searches + len(missions)
+    for mission, positions in zip(missions, trajectories):
+        assert np.allclose(positions[-1], mission[2:])
+
+def test_click_inside_obstacle_keeps_the_plan(counting_planner):
+    planner = counting_planner
+    driver = ConstantVelocityParticle(planner)
+    driver.update(0.05)
+    position = driver.position
+    start, goal, path = planner.start, planner.goal, planner.shortest_path
+    with pytest.raises(ValueError):
+        driver.position = Point(0.3, 0.0)
+    with pytest.raises(ValueError):
+        driver.replan(goal = Point(0.3, 0.0))
+    assert (planner.start, planner.goal) == (start, goal)
+    assert planner.shortest_path is path
+    assert (driver.position.x, driver.position.y) == (position.x, position.y)
+    driver.update(0.05)
+    assert driver.position.x != position.x or driver.position.y != position.y
+    driver.replan(goal = Point(0.9, -0.9))
+    assert planner.goal.y == -0.9
+
+def test_stopped_particle_waits_for_a_new_path(counting_planner):
+    planner = counting_planner
+    driver = ConstantVelocityParticle(planner)
+    driver.update(0.05)
+    position = driver.position
+    #Closes the goal in, the old path now goes through the obstacle
+    with pytest.raises(ValueError):
+        planner.add_polygon(Polygon([
+            Point(0.8, 0.8), Point(0.8, 0.95), Point(0.95, 0.95), Point(0.95, 0.8)
+        ]))
+    driver.stop()
+    driver.update(0.05)
+    assert (driver.position.x, driver.position.y) == (position.x, position.y)
+    assert len(driver.remaining_path().points) == 1
+    driver.replan(goal = Point(0.9, -0.9))
+    driver.update(0.05)
+    assert driver.position.x != position.x or driver.position.y != position.y
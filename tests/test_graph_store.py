@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from scene.scenes import Point
+from planner import VisibilityGraphPlanner, ReducedVisibilityGraphPlanner
+from raster import raster_polygons
+from scene_file import SceneData
+from graph_store import GraphBuilder
+
+
+def path_length(path: object) -> float:
+    points = np.array([[point.x, point.y] for point in path])
+    return np.linalg.norm(np.diff(points, axis=0), axis=1).sum()
+
+@pytest.mark.parametrize("planner_class", (
+    VisibilityGraphPlanner,
+    ReducedVisibilityGraphPlanner
+))
+@pytest.mark.parametrize("seed", range(3))
+def test_store_paths_match_planner(
+        backend,
+        rectangles_map,
+        tmp_path,
+        planner_class,
+        seed
+    ):
+    polygons = raster_polygons(rectangles_map(seed))
+    data = SceneData.from_polygons(polygons)
+    store = GraphBuilder(
+        data,
+        str(tmp_path),
+        reduced = planner_class.reduced,
+        pairs_per_block = 5000
+    ).run()
+    planner = planner_class(
+        SimpleNamespace(scene_data=data),
+        Point(-0.99, 0.99),
+        Point(0.99, -0.99)
+    )
+    assert store.n_vertices == planner.n_vertices
+
+    rng = np.random.default_rng(seed)
+    for x0, y0, x1, y1 in rng.uniform(-1, 1, (30, 4)):
+        start, goal = Point(x0, y0), Point(x1, y1)
+        try:
+            expected = path_length(planner.plan(start, goal))
+        except ValueError:
+            with pytest.raises(ValueError):
+                store.plan(start, goal)
+            continue
+        assert path_length(store.plan(start, goal)) == pytest.approx(expected)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from scene.profiler import profiler
+from raster import raster_polygons
+from scene_file import SceneData
+from geometry import neighbour_indices, polygon_ids
+import kernels
+
+
+@pytest.fixture
+def counting():
+    enabled = profiler.enabled
+    profiler.enable()
+    profiler.end_frame()
+    yield profiler
+    profiler.end_frame()
+    profiler.enabled = enabled
+
+def test_use_numba_without_numba_raises(monkeypatch):
+    previous = kernels.backend
+    monkeypatch.setattr(kernels, "numba", None)
+    with pytest.raises(RuntimeError):
+        kernels.use("numba")
+    assert kernels.backend is previous
+    assert kernels.use("auto").name == "numpy"
+    kernels.backend = previous
+
+@pytest.mark.parametrize("name", kernels.available())
+@pytest.mark.parametrize("reduced", (False, True))
+def test_vertex_rows_count_intersection_tests(
+        counting,
+        rectangles_map,
+        name,
+        reduced
+    ):
+    data = SceneData.from_polygons(raster_polygons(rectangles_map(0)))
+    offsets = np.asarray(data.offsets)
+    prev, nxt = neighbour_indices(offsets)
+    edges = data.edge_array()
+    backend = kernels.NumbaKernels() if name == "numba" else kernels.NumpyKernels()
+    rows = backend.vertex_rows(
+        np.asarray(data.coords),
+        prev,
+        nxt,
+        polygon_ids(offsets),
+        np.arange(data.n_points),
+        edges,
+        0,
+        data.n_points,
+        reduced
+    )
+    tests = counting.end_frame()["counters"]["intersection_tests"]
+    kept = np.count_nonzero(rows >= 0)
+    assert kept*len(edges) <= tests <= data.n_points**2*len(edges)
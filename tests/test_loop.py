@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from scene.scenes import Loop, Point
+
+
+def chord_distances(points: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    d = b - a
+    norm = np.hypot(*d)
+    if norm == 0:
+        return np.hypot(*(points - a).T)
+    return np.abs(d[0]*(points[:, 1] - a[1]) - d[1]*(points[:, 0] - a[0]))/norm
+
+@pytest.mark.parametrize("seed", range(20))
+def test_skipped_points_stay_within_tolerance(seed):
+    rng = np.random.default_rng(seed)
+    steps = 0.006*rng.normal(0, 1, (300, 2)) + [0.01, 0.0]
+    stroke = np.cumsum(steps, axis=0)
+    loop = Loop(0.02)
+    for x, y in stroke.tolist():
+        loop.append(Point(x, y))
+    if loop.is_loop():
+        pytest.skip("stroke closed on itself")
+    kept = [
+        int(np.flatnonzero((stroke == (point.x, point.y)).all(axis=1))[0])
+        for point in loop.points
+    ]
+    for i, j in zip(kept[:-1], kept[1:]):
+        dist = chord_distances(stroke[i + 1:j], stroke[i], stroke[j])
+        assert np.all(dist <= 0.02 + 1e-12)
+
+def test_long_straight_stroke_keeps_its_ends():
+    x = np.linspace(-0.9, 0.9, 20000)
+    loop = Loop(0.02)
+    for xi, yi in zip(x.tolist(), (0.001*np.sin(50*x)).tolist()):
+        loop.append(Point(xi, yi))
+    assert len(loop.points) == 2
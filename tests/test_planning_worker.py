@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+from scene.scenes import Point
+from shapes import Polygon
+from planning_worker import PlanningWorker
+
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline
+        time.sleep(0.001)
+
+@pytest.fixture
+def worker(counting_planner):
+    worker = PlanningWorker(counting_planner)
+    worker.launch()
+    yield worker
+    worker.stop()
+
+def test_one_search_per_request(worker):
+    searches = worker.planner.searches
+    worker.plan(Point(-0.9, -0.9), Point(0.9, -0.9))
+    wait_for(lambda: worker.plans == 1)
+    worker.stop()
+    assert worker.planner.searches == searches + 1
+    assert worker.result.start == Point(-0.9, -0.9)
+    assert worker.result.goal == Point(0.9, -0.9)
+
+def test_failed_request_restores_last_plan(worker):
+    worker.plan(Point(-0.9, -0.9), Point(2.0, 0.0))
+    wait_for(lambda: worker.error is not None)
+    worker.stop()
+    for endpoints in (worker, worker.planner, worker.result):
+        assert endpoints.start == Point(-0.9, 0.9)
+        assert endpoints.goal == Point(0.9, 0.9)
+    assert worker.plans == 0
+
+def test_polygon_cutting_every_path_marks_it_stale(worker):
+    path = worker.shortest_path
+    worker.add_polygon(Polygon([
+        Point(0.8, 0.8), Point(0.8, 0.95), Point(0.95, 0.95), Point(0.95, 0.8)
+    ]))
+    wait_for(lambda: worker.error is not None)
+    worker.stop()
+    assert worker.stale is path
+    assert worker.shortest_path is path
@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from scene.scenes import Point
+from planner import VisibilityGraphPlanner, ReducedVisibilityGraphPlanner
+from raster import raster_polygons
+from scene_file import SceneData
+from polygon_scene import default_polygons
+from geometry import segment_crossings
+
+PLANNERS = (VisibilityGraphPlanner, ReducedVisibilityGraphPlanner)
+
+
+@pytest.mark.parametrize("planner_class", PLANNERS)
+def test_path_goes_around_vertical_wall(backend, planner_class):
+    grid = np.zeros((100, 100), dtype=bool)
+    grid[20:80, 40:60] = True
+    scene = SimpleNamespace(polygons=raster_polygons(grid))
+    planner = planner_class(scene, Point(-0.9, 0.05), Point(0.9, -0.03))
+    path = np.array([[point.x, point.y] for point in planner.shortest_path])
+    segments = np.hstack([path[:-1], path[1:]])
+    crossings, _, _ = segment_crossings(segments, planner.edge_array)
+    assert not crossings.any()
+    assert len(path) == 4
+
+@pytest.mark.parametrize("planner_class", PLANNERS)
+@pytest.mark.parametrize("seed", range(5))
+def test_graph_edges_stay_outside_obstacles(
+        backend,
+        rectangles_map,
+        inside_obstacles,
+        planner_class,
+        seed
+    ):
+    polygons = raster_polygons(rectangles_map(seed))
+    planner = planner_class(
+        SimpleNamespace(polygons=polygons),
+        Point(-0.99, 0.99),
+        Point(0.99, -0.99)
+    )
+    i, j = planner.static_graph.row, planner.static_graph.col
+    a, b = planner.vertex_array[i], planner.vertex_array[j]
+    crossings, _, _ = segment_crossings(np.hstack([a, b]), planner.edge_array)
+    assert not crossings.any()
+    for f in (0.25, 0.5, 0.75):
+        assert not inside_obstacles((1 - f)*a + f*b, polygons).any()
+
+def test_visible_vertex_pairs_stay_in_graph(backend, exact):
+    #Segments ending exactly at an obstacle vertex must not be blocked by
+    #the edges of that vertex
+    data = SceneData.from_polygons(default_polygons)
+    planner = VisibilityGraphPlanner(
+        SimpleNamespace(scene_data=data),
+        Point(-0.9, 0.9),
+        Point(0.9, 0.9)
+    )
+    rings = exact.rings(data)
+    graph = planner.static_graph.tocsr()
+    vertices = planner.vertex_array
+    for i in range(planner.n_vertices):
+        for j in range(i):
+            visible = exact.free(vertices[i], vertices[j], rings)
+            assert (graph[i, j] > 0) == visible, (i, j)
+    assert graph[8, 7] > 0 and graph[9, 7] > 0 and graph[10, 1] > 0
+
+def test_links_from_free_points(backend, exact, inside_obstacles):
+    data = SceneData.from_polygons(default_polygons)
+    planner = VisibilityGraphPlanner(
+        SimpleNamespace(scene_data=data),
+        Point(-0.9, 0.9),
+        Point(0.9, 0.9)
+    )
+    rings = exact.rings(data)
+    rng = np.random.default_rng(0)
+    points = rng.uniform(-1, 1, (200, 2))
+    points = points[~inside_obstacles(points, default_polygons)][:50]
+    for point in points:
+        row = planner.link_point(Point(*point))
+        for vertex, length in zip(planner.vertex_array, row):
+            assert (length >= 0) == exact.free(point, vertex, rings)
+
+def test_route_around_the_right_obstacle():
+    scene = SimpleNamespace(polygons=default_polygons)
+    planner = VisibilityGraphPlanner(
+        scene,
+        Point(0.929, -0.593),
+        Point(0.515, 0.146)
+    )
+    path = np.array([[point.x, point.y] for point in planner.shortest_path])
+    assert np.linalg.norm(np.diff(path, axis=0), axis=1).sum() < 1.1
@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from scene.scenes import Point
+from shapes import Polygon
+from planner import VisibilityGraphPlanner
+from raster import raster_polygons
+from scene_file import SceneData
+from polygon_scene import default_polygons
+from visibility import visibility_polygons
+from geometry import points_in_polygon, segments_free
+from fleet import free_points
+
+
+def boundary_distance(points: np.ndarray, ring: np.ndarray) -> np.ndarray:
+    a, b = ring, np.roll(ring, -1, axis=0)
+    ab = b - a
+    t = np.sum((points[:, None] - a)*ab, axis=2)/np.sum(ab*ab, axis=1)
+    closest = a + np.clip(t, 0, 1)[..., None]*ab
+    return np.linalg.norm(points[:, None] - closest, axis=2).min(axis=1)
+
+@pytest.fixture(params = ("default", "rectangles"))
+def data(request, rectangles_map):
+    if request.param == "default":
+        return SceneData.from_polygons(default_polygons)
+    return SceneData.from_polygons(raster_polygons(rectangles_map(3, 8)))
+
+def test_masks_match_exact_visibility(data, exact):
+    points = free_points(data, 30, np.random.default_rng(0))
+    _, visible = visibility_polygons(points, data.coords, data.offsets)
+    rings = exact.rings(data)
+    coords = np.asarray(data.coords)
+    for point, row in zip(points, visible):
+        expected = [exact.free(point, vertex, rings) for vertex in coords]
+        assert row.tolist() == expected
+
+def test_polygons_match_brute_force(data):
+    rng = np.random.default_rng(1)
+    points = free_points(data, 10, rng)
+    polygons, _ = visibility_polygons(points, data.coords, data.offsets)
+    edges = data.edge_array()
+    samples = rng.uniform(-1, 1, (2000, 2))
+    for point, ring in zip(points, polygons.polygons):
+        ring = ring.array()
+        assert np.sum(ring[:, 0]*np.roll(ring[:, 1], -1) - np.roll(ring[:, 0], -1)*ring[:, 1]) < 0
+        #Samples right on the boundary could go either way
+        clear = samples[boundary_distance(samples, ring) > 1e-9]
+        segments = np.hstack([np.broadcast_to(point, clear.shape), clear])
+        seen = segments_free(segments, edges)
+        assert np.array_equal(points_in_polygon(clear, ring), seen)
+
+def test_point_inside_obstacle_sees_nothing():
+    data = SceneData.from_polygons(default_polygons)
+    polygons, visible = visibility_polygons([[0.3, 0.0]], data.coords, data.offsets)
+    assert polygons.n_points == 0
+    assert not visible.any()
+
+def test_link_rows_match_link_point(backend, rectangles_map):
+    #Grid aligned points put many vertices on one ray and on edge lines
+    data = SceneData.from_polygons(raster_polygons(rectangles_map(1)))
+    planner = VisibilityGraphPlanner(
+        SimpleNamespace(scene_data=data),
+        Point(-0.99, 0.99),
+        Point(0.99, -0.99)
+    )
+    rng = np.random.default_rng(2)
+    points = [np.round(free_points(data, 40, rng), 2), free_points(data, 40, rng)]
+    for start, goal in free_points(data, 20, rng).reshape(-1, 2, 2):
+        try:
+            path = planner.plan(Point(*start), Point(*goal))
+        except ValueError:
+            continue
+        #Path vertices and points sliding along obstacle sides
+        path = np.array([[point.x, point.y] for point in path])
+        points.append(path)
+        points.append((path[1:] + path[:-1])/2)
+    points = np.vstack(points)
+    expected = np.array([planner.link_point(Point(*point)) for point in points])
+    assert np.array_equal(planner.link_rows(points), expected)
+
+def test_link_rows_with_overlapping_obstacles():
+    scene = SimpleNamespace(polygons=list(default_polygons))
+    planner = VisibilityGraphPlanner(scene, Point(-0.9, 0.9), Point(0.9, 0.9))
+    planner.extend_graph(Polygon([
+        Point(0.1, 0.1), Point(0.5, 0.1), Point(0.5, -0.5), Point(0.1, -0.5)
+    ]))
+    assert planner.overlapping
+    points = free_points(planner.scene_data, 50, np.random.default_rng(3))
+    expected = np.array([planner.link_point(Point(*point)) for point in points])
+    assert np.array_equal(planner.link_rows(points), expected)